@@ -0,0 +1,222 @@
+import asyncio
+import atexit
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import aiohttp
+from OCR缓存 import OCRCache
+from OCR端点池 import EndpointPool
+from 运行统计 import metrics
+
+OCR_URL = "http://localhost:9999/api/ocr"
+# 可以配置多个 OCR 服务实例，请求按在途数量均衡分配
+OCR_URLS = [OCR_URL]
+OCR_CACHE_PATH = "ocr_cache.db"
+# 健康检查用的 1x1 白色 PNG
+HEALTH_CHECK_IMAGE = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAAAAAA6fptVAAAACklEQVQIHWP4DwABAQEANl9ngAAAAABJRU5ErkJggg=="
+
+
+class OCRFailure(list):
+    """请求失败时返回的空结果：用法与空列表相同，可以用 isinstance 与“没有识别到文字”区分。"""
+
+
+class OCRClient:
+    """
+    共享的 OCR 客户端：后台线程运行 asyncio 事件循环，持久连接池复用 TCP 连接。
+    urls 指定多个 OCR 服务实例时由 EndpointPool 均衡分配、熔断故障实例，每个实例最多同时 max_in_flight 个请求；
+    health_interval 秒做一次主动健康检查（为 0 时关闭）。
+    submit() 可以在任意线程调用，返回 concurrent.futures.Future。
+    """
+
+    def __init__(self, url=OCR_URL, max_in_flight=8, max_retries=3, timeout=10, deadline=30,
+                 backoff_base=0.5, backoff_max=8, cache=None, urls=None, health_interval=5, health_timeout=2,
+                 failure_threshold=3, cooldown=5):
+        self.urls = list(urls) if urls else [url]
+        self.url = self.urls[0]
+        self.cache = cache
+        self.per_endpoint_in_flight = max_in_flight
+        # 所有实例合计的并发上限，ocr_in_order 按它限制在途数量
+        self.max_in_flight = max_in_flight * len(self.urls)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.deadline = deadline
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    async def _start(self):
+        self.pool = EndpointPool(self.urls, self.per_endpoint_in_flight, self.failure_threshold, self.cooldown)
+        # 健康检查另外占用连接，不挤占请求的名额
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight + len(self.urls), keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.health_task = asyncio.create_task(self._health_checks()) if self.health_interval else None
+
+    async def _check_health(self, endpoint):
+        data = {"base64": HEALTH_CHECK_IMAGE, "lang": "eng"}
+        try:
+            async with self.session.post(endpoint.url, json=data,
+                                         timeout=aiohttp.ClientTimeout(total=self.health_timeout)) as response:
+                response.raise_for_status()
+                result = await response.json(content_type=None)
+            healthy = isinstance(result, dict) and "code" in result
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            healthy = False
+        self.pool.report_health(endpoint, healthy)
+
+    async def _health_checks(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self._check_health(endpoint) for endpoint in self.pool.endpoints))
+
+    # 指数退避 + 全抖动
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    # 解析 OCR 返回，得到带 text 的条目列表；其他错误码或无法识别的格式返回 None，按失败处理，不写入缓存
+    @staticmethod
+    def _parse(result):
+        if not isinstance(result, dict):
+            print(f"Unexpected response format: {result}")
+            return None
+        if result.get("code") == 101:  # No text found
+            return []
+        if isinstance(result.get("data"), list):
+            return [item for item in result["data"] if isinstance(item, dict) and isinstance(item.get("text"), str)]
+        print(f"OCR error response: {result}")
+        return None
+
+    async def _post_with_retries(self, data):
+        for attempt in range(self.max_retries):
+            # 只在真正发请求时占用端点的名额，退避等待期间让出；重试时可能换到另一个端点
+            endpoint = await self.pool.acquire()
+            start = time.perf_counter()
+            ok = False
+            try:
+                with metrics.timer("http"):
+                    async with self.session.post(endpoint.url, json=data) as response:
+                        response.raise_for_status()
+                        result = await response.json(content_type=None)
+                ok = True
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"Request to {endpoint.url} failed: {e!r}, retrying {attempt + 1}/{self.max_retries}")
+            except asyncio.CancelledError:
+                ok = None  # 超过截止时间被 wait_for 取消，不是端点的问题
+                raise
+            finally:
+                self.pool.release(endpoint, time.perf_counter() - start, ok)
+            if ok:
+                metrics.add_bytes("http", len(data["base64"]))
+                items = self._parse(result)
+                if items is not None:
+                    return items
+                # 服务返回了错误码：实例本身可用，不计入端点的失败，按普通失败重试
+            if attempt + 1 < self.max_retries:
+                metrics.count("ocr_retries")
+                await asyncio.sleep(self._backoff(attempt))
+        metrics.count("ocr_failures")
+        return None
+
+    # 返回条目列表；重试耗尽或超过截止时间时返回 None
+    async def _ocr_items(self, encoded_string, lang):
+        data = {"base64": encoded_string, "lang": lang}
+        try:
+            return await asyncio.wait_for(self._post_with_retries(data), self.deadline)
+        except asyncio.TimeoutError:
+            print(f"OCR request exceeded deadline of {self.deadline}s, giving up")
+            metrics.count("ocr_failures")
+            return None
+
+    async def _ocr_texts(self, encoded_string, lang, cache_key):
+        items = await self._ocr_items(encoded_string, lang)
+        if items is None:
+            return OCRFailure()
+        texts = [item["text"].strip() for item in items]
+        # 只缓存成功的结果，失败的帧下次仍会重新识别
+        self.store_cached(cache_key, texts)
+        return texts
+
+    # 查询缓存，返回 (缓存键, 文本列表或 None)；未启用缓存或没有指纹时键为 None
+    def lookup_cached(self, frame_hash, lang):
+        if self.cache is None or frame_hash is None:
+            return None, None
+        cache_key = self.cache.make_key(frame_hash, lang)
+        texts = self.cache.get(cache_key)
+        metrics.count("ocr_cache_hits" if texts is not None else "ocr_cache_misses")
+        return cache_key, texts
+
+    # 在线程池中写入缓存，不阻塞事件循环；可以在任意线程调用
+    def store_cached(self, cache_key, texts):
+        if cache_key is not None:
+            self.loop.call_soon_threadsafe(self.loop.run_in_executor, None, self.cache.put, cache_key, texts)
+
+    # 提交一张 base64 图片，Future 的结果是识别出的文本列表，请求失败时为空的 OCRFailure。
+    # 提供 frame_hash 时先查缓存，命中则不发请求
+    def submit(self, encoded_string, lang="eng", frame_hash=None):
+        cache_key, texts = self.lookup_cached(frame_hash, lang)
+        if texts is not None:
+            future = Future()
+            future.set_result(texts)
+            return future
+        coroutine = self._ocr_texts(encoded_string, lang, cache_key)
+        return asyncio.run_coroutine_threadsafe(metrics.bind(coroutine), self.loop)
+
+    # 提交一张 base64 图片，Future 的结果是带 box 坐标的原始条目列表，请求失败时为 None；不经过缓存
+    def submit_items(self, encoded_string, lang="eng"):
+        return asyncio.run_coroutine_threadsafe(metrics.bind(self._ocr_items(encoded_string, lang)), self.loop)
+
+    def ocr(self, encoded_string, lang="eng", frame_hash=None):
+        return self.submit(encoded_string, lang, frame_hash).result()
+
+    def endpoint_report(self):
+        return self.pool.report()
+
+    def endpoint_stats(self):
+        return self.pool.stats()
+
+    async def _shutdown(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+        await self.session.close()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+# 进程内共享一个客户端，所有线程共用同一个连接池和并发上限
+def get_default_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OCRClient(urls=OCR_URLS, cache=OCRCache(OCR_CACHE_PATH))
+            atexit.register(_default_client.close)
+        return _default_client
+
+
+# 按提交顺序收集结果：输入 (key, base64, 帧指纹) 序列，输出 (key, 文本列表)；
+# 在途请求达到 window 时先等待最早的一个，上游的帧读取也随之暂停
+def ocr_in_order(client, items, lang="eng", window=None):
+    window = window or client.max_in_flight
+    pending = deque()
+    for key, encoded_string, frame_hash in items:
+        pending.append((key, client.submit(encoded_string, lang, frame_hash)))
+        if len(pending) >= window:
+            key, future = pending.popleft()
+            yield key, future.result()
+    for key, future in pending:
+        yield key, future.result()
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Endpoint:
+    """一个 OCR 服务实例：在途请求数、熔断状态和最近的延迟样本。"""
+
+    def __init__(self, url, latency_samples=1000):
+        self.url = url
+        self.state = CLOSED
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_level = 0
+        self.open_until = 0.0
+        self.latencies = deque(maxlen=latency_samples)
+        self.ewma = 0.0
+
+    # 熔断打开期满后进入半开状态，只放行一个试探请求
+    def available(self, now, limit):
+        if self.state == OPEN:
+            if now < self.open_until:
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return self.outstanding == 0
+        return self.outstanding < limit
+
+    def trip(self, now, cooldown, max_cooldown):
+        self.trips += 1
+        self.open_level += 1
+        self.state = OPEN
+        self.open_until = now + min(max_cooldown, cooldown * 2 ** (self.open_level - 1))
+
+    def close(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_level = 0
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        p50, p99 = _percentile(latencies, 0.5), _percentile(latencies, 0.99)
+        return {
+            "url": self.url,
+            "state": self.state,
+            "requests": self.requests,
+            "failures": self.failures,
+            "trips": self.trips,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+        }
+
+
+class EndpointPool:
+    """
+    多个 OCR 端点的负载均衡：选择在途请求最少的可用端点（相同时选平均延迟较低的），
+    每个端点最多同时 max_in_flight 个请求。连续失败 failure_threshold 次的端点熔断 cooldown 秒，
+    再次失败时熔断时间翻倍（不超过 max_cooldown），期满后半开放行一个请求试探。
+    主动健康检查的失败与请求失败一样计入连续失败次数；只有半开状态下的成功才结束熔断。
+    所有方法都在客户端的事件循环线程中调用。
+    """
+
+    def __init__(self, urls, max_in_flight=8, failure_threshold=3, cooldown=5, max_cooldown=60):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.max_in_flight = max_in_flight
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.changed = asyncio.Event()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.available(now, self.max_in_flight)]
+            if candidates:
+                endpoint = min(candidates, key=lambda e: (e.outstanding, e.ewma))
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+                return endpoint
+            # 全部满载或熔断：等到有请求完成，或最早的熔断期满
+            reopen = [endpoint.open_until - now for endpoint in self.endpoints if endpoint.state == OPEN]
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), max(0.01, min(reopen)) if reopen else None)
+            except asyncio.TimeoutError:
+                pass
+
+    # 熔断前发出的请求在打开期间成功，不能说明实例已经恢复，只有半开的试探请求成功才关闭熔断
+    def _record_success(self, endpoint):
+        if endpoint.state == HALF_OPEN:
+            endpoint.close()
+        elif endpoint.state == CLOSED:
+            endpoint.consecutive_failures = 0
+
+    def _record_failure(self, endpoint):
+        endpoint.consecutive_failures += 1
+        if endpoint.state == HALF_OPEN or (endpoint.state == CLOSED
+                                           and endpoint.consecutive_failures >= self.failure_threshold):
+            endpoint.trip(time.monotonic(), self.cooldown, self.max_cooldown)
+
+    # ok 为 None 表示请求被取消（例如到了截止时间），既不算成功也不算失败
+    def release(self, endpoint, latency, ok):
+        endpoint.outstanding -= 1
+        if ok:
+            endpoint.latencies.append(latency)
+            endpoint.ewma = latency if not endpoint.ewma else 0.8 * endpoint.ewma + 0.2 * latency
+            self._record_success(endpoint)
+        elif ok is not None:
+            endpoint.failures += 1
+            self._record_failure(endpoint)
+        self.changed.set()
+
+    # 主动健康检查的结果：失败和请求失败一样累计到 failure_threshold 才熔断；
+    # 打开期间检查成功则提前进入半开，由下一个请求试探
+    def report_health(self, endpoint, healthy):
+        if not healthy:
+            self._record_failure(endpoint)
+        elif endpoint.state == OPEN:
+            endpoint.state = HALF_OPEN
+        else:
+            self._record_success(endpoint)
+        self.changed.set()
+
+    def stats(self):
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    def report(self):
+        lines = []
+        for stats in self.stats():
+            latency = (f"p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms"
+                       if stats["p50_ms"] is not None else "no successful requests")
+            lines.append(f"{stats['url']}: {stats['requests']} requests, {stats['failures']} failures, "
+                         f"{stats['trips']} trips, {latency}, {stats['state']}")
+        return "\n".join(lines)
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from 数据库 import SQLiteStore
+
+
+class OCRCache(SQLiteStore):
+    """
+    以帧指纹 + 语言为键的 OCR 结果缓存。
+    内存 LRU 保存最近使用的 memory_size 条，磁盘层（SQLite）最多保存 max_entries 条，
+    超出时按最近使用时间淘汰最旧的一批。重启后磁盘层仍然有效。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ocr_cache (
+        key TEXT PRIMARY KEY,
+        texts TEXT NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ocr_cache_last_used ON ocr_cache (last_used);
+    """
+
+    def __init__(self, db_path, memory_size=4096, max_entries=500000):
+        super().__init__(db_path)
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.entries = self.connection().execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(frame_hash, lang):
+        return f"{frame_hash:x}:{lang}"
+
+    def _remember(self, key, texts):
+        with self.lock:
+            self.memory[key] = texts
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            texts = self.memory.get(key)
+            if texts is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return texts
+
+        conn = self.connection()
+        row = conn.execute("SELECT texts FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        with conn:
+            conn.execute("UPDATE ocr_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        texts = json.loads(row[0])
+        self._remember(key, texts)
+        with self.lock:
+            self.disk_hits += 1
+        return texts
+
+    def put(self, key, texts):
+        self._remember(key, texts)
+        conn = self.connection()
+        with conn:
+            row = (key, json.dumps(texts, ensure_ascii=False), time.time())
+            cursor = conn.execute("INSERT OR IGNORE INTO ocr_cache (key, texts, last_used) VALUES (?, ?, ?)", row)
+            # 已有的键只更新内容，不计入新增条目
+            if not cursor.rowcount:
+                conn.execute("UPDATE ocr_cache SET texts = ?, last_used = ? WHERE key = ?", row[1:] + row[:1])
+            with self.lock:
+                self.entries += cursor.rowcount
+                evict = self.entries > self.max_entries
+            if evict:
+                # 一次淘汰 10%，避免每次写入都触发删除
+                conn.execute(
+                    "DELETE FROM ocr_cache WHERE key IN (SELECT key FROM ocr_cache ORDER BY last_used LIMIT ?)",
+                    (max(1, self.max_entries // 10),),
+                )
+                entries = conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+                with self.lock:
+                    self.entries = entries
+
+    def report(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hit_rate = (self.memory_hits + self.disk_hits) / lookups if lookups else 0
+        return (f"OCR cache: {self.memory_hits} memory hits, {self.disk_hits} disk hits, "
+                f"{self.misses} misses ({hit_rate:.0%} hit rate), {self.entries} entries on disk")
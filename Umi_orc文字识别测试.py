@@ -1,103 +1,129 @@
 import cv2
-import base64
-import requests
 from pathlib import Path
 from tqdm import tqdm
-import hashlib
-import time
-
-def similar(a, b):
-    from difflib import SequenceMatcher
-    return SequenceMatcher(None, a, b).ratio()
-
-def file_hash(filepath):
-    with open(filepath, "rb") as f:
-        file_hash = hashlib.md5()
-        while chunk := f.read(4096):
-            file_hash.update(chunk)
-    return file_hash.hexdigest()
-
-def extract_text_from_video(video_path, similarity_threshold=0.8, max_retries=3):
+from 帧指纹 import FrameDeduper
+from 拼图批处理 import MosaicBatcher
+from OCR客户端 import get_default_client, ocr_in_order
+from 处理清单 import VideoManifest
+from 帧检查点 import FrameCheckpoint, IncompleteVideo
+from 视频指纹 import VideoFingerprintIndex
+from 文字索引 import TextSearchIndex
+from 视频采样 import FrameSeeker, SamplingReport, adaptive_sample, sample_frames_opencv
+from 运行统计 import metrics
+from 识别视频内关键帧上文字 import collect_texts, find_duplicate_texts, select_frames_for_ocr
+
+# max_retries 只为兼容旧的位置参数调用保留，重试次数由 OCR 客户端统一配置；其余参数只能按关键字传入
+def extract_text_from_video(video_path, similarity_threshold=0.8, max_retries=3, *, max_hash_distance=4,
+                            client=None, sample_interval=1.0, sampling="grab", min_gap=0.25, crop_text=True,
+                            batch_size=None, deduper=None, checkpoint=None, timestamps=None):
     cap = cv2.VideoCapture(str(video_path))
     if not cap.isOpened():
         print(f"Error: Cannot open video {video_path}")
         return []
     
-    fps = int(cap.get(cv2.CAP_PROP_FPS))  # 获取视频的帧率
-    frame_interval = fps  # 每秒处理一帧
-    frame_number = 0
-    extracted_texts = []
-    last_text = ""  # 保存上一次识别的文本
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        if frame_number % frame_interval == 0:  # 每隔一秒提取一帧
-            retval, buffer = cv2.imencode('.jpg', frame)
-            if retval:
-                encoded_string = base64.b64encode(buffer).decode('utf-8')
-                # 这里指定语言为简体中文 'chi_sim'
-                data = {'base64': encoded_string, "lang": "eng"}
-
-                for attempt in range(max_retries):
-                    try:
-                        response = requests.post('http://localhost:9999/api/ocr', json=data, timeout=10)
-                        response.raise_for_status()  # 检查请求是否成功
-                        result = response.json()
-
-                        # 检查返回的结果
-                        if result.get('code') == 101 and "No text found" in result.get('data', ''):
-                            print(f"No text found in frame {frame_number // fps} (seconds).")
-                        elif 'data' in result and isinstance(result['data'], list):
-                            for item in result['data']:
-                                if isinstance(item, dict) and 'text' in item:
-                                    text = item['text'].strip()
-
-                                    # 只添加与上一次不同的文本
-                                    if text != last_text and not any(similar(text, recorded_text) > similarity_threshold for recorded_text in extracted_texts):
-                                        extracted_texts.append(text)
-                                        last_text = text  # 更新上一次识别的文本
-                        else:
-                            print(f"Unexpected response format: {result}")
-
-                        break  # 成功则跳出重试循环
-                    except requests.RequestException as e:
-                        print(f"Request failed: {e}, retrying {attempt + 1}/{max_retries}")
-                        time.sleep(2)  # 等待 2 秒后重试
-
-            # 释放资源
-            del buffer  # 释放内存中的图像编码缓冲区
-            cv2.destroyAllWindows()  # 清除OpenCV中的窗口缓存
-
-        frame_number += 1
-
-    cap.release()  # 释放视频资源
+    client = client or get_default_client()
+    deduper = deduper or FrameDeduper(max_distance=max_hash_distance)
+    # 传入 checkpoint 时逐帧保存结果，从上次中断的位置继续
+    progress = checkpoint.open(video_path) if checkpoint is not None else None
+    start = 0.0
+    if progress is not None and progress.done:
+        deduper.last_hash = progress.last_hash
+        start = progress.start_time(sample_interval)
+
+    sampling_report = SamplingReport()
+    # batch_size 大于 1 时把多帧的文字区域拼成一张图识别
+    batcher = MosaicBatcher(client, batch_size) if batch_size and batch_size > 1 else None
+
+    def sample_frames():
+        # adaptive：粗采样用 grab 模式，画面变化的区间再跳转加密
+        if sampling == "adaptive":
+            seeker = FrameSeeker(video_path)
+            try:
+                coarse_frames = sample_frames_opencv(cap, sample_interval, "grab", start=start)
+                yield from adaptive_sample(coarse_frames, seeker, min_gap=min_gap, report=sampling_report)
+            finally:
+                seeker.release()
+        else:
+            yield from sample_frames_opencv(cap, sample_interval, sampling, video_path, start)
+
+    # 默认每秒取一帧，只解码/转换需要的帧；画面与上一次识别的帧几乎相同时跳过 OCR。
+    # 只发送裁剪出的文字区域，没有文字区域的帧不发送
+    frames = select_frames_for_ocr(sample_frames(), deduper, crop_text, encode=batcher is None)
+
+    # 这里指定语言为英文 'eng'；多帧并发识别，结果仍按帧顺序合并
+    try:
+        with metrics.scope(video=Path(video_path).name), metrics.timer("video"):
+            if progress is None:
+                ocr_results = ocr_in_order(batcher or client, frames, lang="eng")
+            else:
+                ocr_results = progress.results(ocr_in_order(batcher or client, progress.watch(frames), lang="eng"))
+            extracted_texts = collect_texts(ocr_results, similarity_threshold, timestamps)
+    finally:
+        if batcher is not None:
+            batcher.close()
+        cap.release()  # 释放视频资源
+    if sampling == "adaptive":
+        print(sampling_report.summary(Path(video_path).name))
+    print(deduper.report(Path(video_path).name))
     return extracted_texts
 
-def process_videos(folder_path, output_file_path, record_file_path):
+# metrics_file / metrics_port 任一指定时开启分阶段统计，结束时打印汇总表并写出指标文件
+def process_videos(folder_path, output_file_path, record_file_path, metrics_file=None, metrics_port=None):
     video_files = list(Path(folder_path).glob('*.mp4'))
-    processed_videos = set()
-
-    if Path(record_file_path).exists():
-        with open(record_file_path, 'r') as rf:
-            processed_videos = set(rf.read().splitlines())
-
-    for video_file in tqdm(video_files, desc="Processing Videos", unit="video"):
-        video_hash = file_hash(video_file)
-        if video_hash not in processed_videos:
-            extracted_texts = extract_text_from_video(video_file)
-
-            with open(output_file_path, 'a', encoding='utf-8') as output_file:
-                output_file.write(f"Results for {video_file.name}:\n")
-                for text in extracted_texts:
-                    output_file.write(f"{text}\n")
-                output_file.write("\n")  # 分隔不同视频的结果
-
-            with open(record_file_path, 'a', encoding='utf-8') as record_file:
-                record_file.write(f"{video_hash}\n")
-            processed_videos.add(video_hash)
+    # 已处理清单存放在记录文件旁的 .db 中，旧的 MD5 记录文件仍然有效
+    manifest = VideoManifest(Path(record_file_path).with_suffix('.db'), legacy_record_file=record_file_path)
+    # 逐帧检查点也放在记录文件旁边，中断的视频下次从断点继续
+    record_path = Path(record_file_path)
+    checkpoint = FrameCheckpoint(record_path.with_name(f"{record_path.stem}_checkpoints.db"))
+    # 已识别视频的视频级指纹，重新转码的转发直接复用之前的文字
+    video_index = VideoFingerprintIndex(record_path.with_name(f"{record_path.stem}_fingerprints.db"))
+    # 识别文字的全文索引，可以用 文字索引.py search 查询
+    text_index = TextSearchIndex(record_path.with_name(f"{record_path.stem}_texts.db"))
+    if metrics_file or metrics_port:
+        metrics.start(metrics_port)
+
+    try:
+        for video_file in tqdm(video_files, desc="Processing Videos", unit="video"):
+            with metrics.scope(folder=Path(folder_path).name, video=video_file.name):
+                with metrics.timer("manifest"):
+                    processed = manifest.is_processed(video_file)
+                if processed:
+                    metrics.count("videos_skipped")
+                    continue
+                fingerprint, extracted_texts = find_duplicate_texts(video_file, video_index)
+                if extracted_texts is not None:
+                    timestamps = None
+                else:
+                    timestamps = []
+                    try:
+                        extracted_texts = extract_text_from_video(video_file, checkpoint=checkpoint,
+                                                                  timestamps=timestamps)
+                    except IncompleteVideo as e:
+                        metrics.count("videos_failed")
+                        print(f"Incomplete {video_file.name}: {e}")
+                        continue
+                    video_index.add(video_file, fingerprint, extracted_texts)
+
+                with metrics.timer("save"), open(output_file_path, 'a', encoding='utf-8') as output_file:
+                    output_file.write(f"Results for {video_file.name}:\n")
+                    for text in extracted_texts:
+                        output_file.write(f"{text}\n")
+                    output_file.write("\n")  # 分隔不同视频的结果
+                if extracted_texts:
+                    with metrics.timer("index"):
+                        text_index.add_video(Path(folder_path).name, video_file.name, extracted_texts, timestamps)
+
+                with metrics.timer("manifest"):
+                    manifest.mark_processed(video_file)
+                    checkpoint.clear(video_file)
+                metrics.count("videos_processed")
+    finally:
+        metrics.finish(metrics_file)
+
+    client = get_default_client()
+    print(client.endpoint_report())
+    if client.cache is not None:
+        print(client.cache.report())
 
 if __name__ == '__main__':
     folder_path = r"D:\software\工作文件夹\代码\instagram_crawl\下载视频2\en\manwruu"
@@ -0,0 +1,86 @@
+import hashlib
+import os
+from pathlib import Path
+from 数据库 import SQLiteStore
+
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+# 完整 MD5，只用于兼容旧的 processed_videos.txt 记录
+def file_md5(filepath):
+    with open(filepath, "rb") as f:
+        file_hash = hashlib.md5()
+        while chunk := f.read(READ_BUFFER_SIZE):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+# 抽样指纹：文件大小 + 均匀分布的若干个 1MB 数据块，小文件直接读全文
+def fast_fingerprint(filepath, size=None, samples=5, chunk_size=READ_BUFFER_SIZE):
+    size = os.path.getsize(filepath) if size is None else size
+    fingerprint = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(filepath, "rb", buffering=0) as f:
+        if size <= samples * chunk_size:
+            while chunk := f.read(READ_BUFFER_SIZE):
+                fingerprint.update(chunk)
+        else:
+            step = (size - chunk_size) // (samples - 1)
+            for i in range(samples):
+                f.seek(i * step)
+                fingerprint.update(f.read(chunk_size))
+    return fingerprint.hexdigest()
+
+
+class VideoManifest(SQLiteStore):
+    """
+    已处理视频清单。先按 (路径, 大小, 修改时间) 判断，未变化的文件不读内容；
+    变化或新出现的文件才计算抽样指纹，指纹相同视为同一视频（例如被移动或重命名）。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS videos (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        fingerprint TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS videos_fingerprint ON videos (fingerprint);
+    """
+
+    def __init__(self, db_path, legacy_record_file=None):
+        super().__init__(db_path)
+        # 旧版记录的是完整 MD5，只有清单里找不到的文件才需要回退比对
+        self.legacy_hashes = set()
+        if legacy_record_file and Path(legacy_record_file).exists():
+            with open(legacy_record_file, "r") as rf:
+                self.legacy_hashes = set(rf.read().splitlines())
+
+    def _record(self, conn, path, stat, fingerprint):
+        conn.execute(
+            "INSERT OR REPLACE INTO videos (path, size, mtime_ns, fingerprint) VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, fingerprint),
+        )
+
+    def is_processed(self, video_path):
+        path = str(Path(video_path).resolve())
+        stat = os.stat(path)
+        conn = self.connection()
+        row = conn.execute("SELECT size, mtime_ns FROM videos WHERE path = ?", (path,)).fetchone()
+        if row == (stat.st_size, stat.st_mtime_ns):
+            return True
+
+        fingerprint = fast_fingerprint(path, stat.st_size)
+        known = conn.execute("SELECT 1 FROM videos WHERE fingerprint = ? LIMIT 1", (fingerprint,)).fetchone()
+        if known or (self.legacy_hashes and file_md5(path) in self.legacy_hashes):
+            with conn:
+                self._record(conn, path, stat, fingerprint)
+            return True
+        return False
+
+    def mark_processed(self, video_path):
+        path = str(Path(video_path).resolve())
+        stat = os.stat(path)
+        fingerprint = fast_fingerprint(path, stat.st_size)
+        conn = self.connection()
+        with conn:
+            self._record(conn, path, stat, fingerprint)
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+
+# 计算帧的 dHash：缩小后的灰度图中相邻像素比较，打包成一个整数。
+# 相邻差值在 ±margin 以内视为平坦区域，避免压缩噪声翻转大量位；变亮、变暗各占一组位
+def dhash(frame, hash_size=32, margin=4):
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    diff = small[:, 1:] - small[:, :-1]
+    bits = np.concatenate([(diff > margin).ravel(), (diff < -margin).ravel()])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+# 两个哈希之间不同的位数
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class FrameDeduper:
+    """
+    OCR 前的帧去重：与上一次送去 OCR 的帧比较指纹，汉明距离不超过 max_distance 时跳过。
+    """
+
+    def __init__(self, max_distance=4, hash_size=32):
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self.last_hash = None
+        self.total = 0
+        self.skipped = 0
+
+    # 返回 True 表示这一帧需要 OCR
+    def should_ocr(self, frame):
+        self.total += 1
+        frame_hash = dhash(frame, self.hash_size)
+        if self.last_hash is not None and hamming(frame_hash, self.last_hash) <= self.max_distance:
+            self.skipped += 1
+            return False
+        self.last_hash = frame_hash
+        return True
+
+    def report(self, video_name):
+        return f"{video_name}: skipped {self.skipped}/{self.total} OCR calls by frame dedup"
@@ -0,0 +1,107 @@
+import json
+import math
+import os
+from itertools import chain
+from pathlib import Path
+from 数据库 import SQLiteStore
+from OCR客户端 import OCRFailure
+from 运行统计 import metrics
+
+
+class IncompleteVideo(Exception):
+    """视频中有帧识别失败；失败之前的结果已保存在检查点中，下次运行从这里继续。"""
+
+
+# timestamp 之后的下一个采样时间点（按 interval 对齐）
+def next_sample_time(timestamp, interval):
+    return (math.floor(timestamp / interval + 1e-9) + 1) * interval
+
+
+class FrameCheckpoint(SQLiteStore):
+    """
+    逐帧保存 OCR 结果。视频处理到一半失败或进程退出后，下次运行从最后一个已保存的时间点之后继续解码，
+    已保存的帧直接回放结果，不再请求 OCR。视频结果写入并记入清单后调用 clear() 删除。
+    文件大小或修改时间变化后，旧的检查点作废。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS frames (
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        timestamp REAL NOT NULL,
+        frame_hash TEXT,
+        texts TEXT NOT NULL,
+        PRIMARY KEY (path, timestamp)
+    );
+    """
+
+    def open(self, video_path):
+        path = str(Path(video_path).resolve())
+        stat = os.stat(video_path)
+        with self.connection() as conn:
+            conn.execute("DELETE FROM frames WHERE path = ? AND (size != ? OR mtime_ns != ?)",
+                         (path, stat.st_size, stat.st_mtime_ns))
+            rows = conn.execute(
+                "SELECT timestamp, frame_hash, texts FROM frames WHERE path = ? ORDER BY timestamp", (path,)
+            ).fetchall()
+        done = [(timestamp, int(frame_hash, 16) if frame_hash else None, json.loads(texts))
+                for timestamp, frame_hash, texts in rows]
+        return VideoProgress(self, path, stat.st_size, stat.st_mtime_ns, done)
+
+    def save(self, progress, timestamp, frame_hash, texts):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO frames (path, size, mtime_ns, timestamp, frame_hash, texts) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (progress.path, progress.size, progress.mtime_ns, timestamp,
+                 format(frame_hash, "x") if frame_hash is not None else None, json.dumps(texts, ensure_ascii=False)),
+            )
+
+    def clear(self, video_path):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM frames WHERE path = ?", (str(Path(video_path).resolve()),))
+
+
+class VideoProgress:
+    """一个视频的检查点：回放已保存的帧，并在新的帧识别完成时逐帧保存。"""
+
+    def __init__(self, checkpoint, path, size, mtime_ns, done):
+        self.checkpoint = checkpoint
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.done = done
+        self.saved_until = done[-1][0] if done else None
+        self.hashes = {}
+
+    # 恢复去重状态所需的最后一帧指纹
+    @property
+    def last_hash(self):
+        return self.done[-1][1] if self.done else None
+
+    # 解码从这个时间点开始；没有检查点时为 0
+    def start_time(self, interval=1.0):
+        return next_sample_time(self.saved_until, interval) if self.done else 0.0
+
+    # 透传 (时间戳, 图片, 帧指纹)，记下每个时间戳的帧指纹，保存时使用
+    def watch(self, frames):
+        for item in frames:
+            self.hashes[item[0]] = item[2]
+            yield item
+
+    def _record(self, ocr_results):
+        for timestamp, texts in ocr_results:
+            if isinstance(texts, OCRFailure):
+                saved = f"{self.saved_until:.2f}s" if self.saved_until is not None else "the start"
+                raise IncompleteVideo(f"OCR failed at {timestamp:.2f}s, progress saved up to {saved}")
+            self.checkpoint.save(self, timestamp, self.hashes.pop(timestamp, None), texts)
+            self.saved_until = timestamp
+            yield timestamp, texts
+
+    # 先按顺序回放已保存的结果，再接上新识别的结果；某一帧识别失败时抛出 IncompleteVideo
+    def results(self, ocr_results):
+        if self.done:
+            metrics.count("frames_resumed", len(self.done))
+        replayed = ((timestamp, texts) for timestamp, _, texts in self.done)
+        return chain(replayed, self._record(ocr_results))
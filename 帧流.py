@@ -0,0 +1,134 @@
+import json
+import math
+import queue
+import subprocess
+import threading
+import numpy as np
+
+
+# 用 ffprobe 读取视频宽高（考虑旋转元数据，ffmpeg 输出时会自动旋转）
+def probe_video(video_path):
+    ffprobe_command = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation:format=duration",
+        "-of", "json",
+        str(video_path)
+    ]
+    output = subprocess.run(ffprobe_command, check=True, capture_output=True).stdout
+    info = json.loads(output)
+    stream = info["streams"][0]
+    width, height = int(stream["width"]), int(stream["height"])
+
+    rotation = stream.get("tags", {}).get("rotate")
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            rotation = side_data["rotation"]
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+
+    duration = float(info.get("format", {}).get("duration") or 0)
+    return width, height, duration
+
+
+# 读满一帧，返回实际读取的字节数
+def _read_exact(stream, view):
+    total = 0
+    while total < len(view):
+        n = stream.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+
+# 从 ffmpeg 的 stdout 管道中逐帧读取原始 BGR 图像，不落盘
+def stream_frames_with_ffmpeg(video_path, interval=1.0, queue_size=4, start=0.0):
+    """
+    每隔 interval 秒取一帧，生成 (时间戳秒, 帧) 元组。帧是复用的 NumPy 缓冲区，只在下一次迭代之前有效，
+    需要保留时请自行 copy()。后台线程最多预读 queue_size 帧，内存占用与视频长度无关。
+    start 大于 0 时跳转到不早于 start 的第一个采样点开始（用于断点续传），时间戳仍从视频开头算起。
+    """
+    width, height, _ = probe_video(video_path)
+    frame_size = width * height * 3
+    first_index = math.ceil(start / interval - 1e-9) if start > 0 else 0
+    # -ss 放在 -i 之前：按关键帧跳转后精确解码到目标时间，跳转后 t 从 0 开始计
+    seek = ["-ss", f"{first_index * interval:.6f}"] if first_index else []
+    ffmpeg_command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        *seek,
+        "-i", str(video_path),
+        # 选取时间戳不早于 k * interval 的第一帧，帧的实际时间与返回的时间戳相差不超过一帧
+        "-vf", f"select='gte(t,selected_n*{interval})'",
+        "-vsync", "vfr",
+        "-f", "rawvideo",
+        "-pix_fmt", "bgr24",
+        "pipe:1"
+    ]
+    process = subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=frame_size)
+
+    # 预分配缓冲池：queue_size 个在队列中，1 个正在读取，1 个在使用方手里
+    free_buffers = queue.Queue()
+    for _ in range(queue_size + 2):
+        free_buffers.put(np.empty((height, width, 3), dtype=np.uint8))
+    filled = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    stderr_chunks = []
+
+    def drain_stderr():
+        for line in process.stderr:
+            stderr_chunks.append(line)
+
+    def reader():
+        index = 0
+        try:
+            while not stop.is_set():
+                buffer = free_buffers.get()
+                if buffer is None:
+                    break
+                if _read_exact(process.stdout, buffer.data.cast("B")) < frame_size:
+                    break
+                filled.put(((first_index + index) * interval, buffer))
+                index += 1
+        finally:
+            filled.put(None)
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    stderr_thread.start()
+    reader_thread.start()
+
+    in_use = None
+    try:
+        while True:
+            item = filled.get()
+            if in_use is not None:
+                free_buffers.put(in_use)
+                in_use = None
+            if item is None:
+                break
+            timestamp, in_use = item
+            yield timestamp, in_use
+
+        process.wait()
+        stderr_thread.join()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, ffmpeg_command, stderr=b"".join(stderr_chunks))
+    finally:
+        # 使用方提前退出时，停止读取线程并结束 ffmpeg
+        stop.set()
+        if process.poll() is None:
+            process.kill()
+        free_buffers.put(None)
+        while reader_thread.is_alive():
+            try:
+                filled.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        process.wait()
+        stderr_thread.join(timeout=1)
+        process.stdout.close()
+        process.stderr.close()
@@ -0,0 +1,193 @@
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from 文字区域 import encode_image
+from OCR客户端 import OCRFailure
+
+
+class _Tile:
+    def __init__(self, image, frame_hash, cache_key, future):
+        self.image = image
+        self.frame_hash = frame_hash
+        self.cache_key = cache_key
+        self.future = future
+        self.top = 0
+
+
+class MosaicBatcher:
+    """
+    把多张裁剪后的文字区域图（可以来自不同视频）纵向拼成一张拼图，一次请求识别，
+    再根据返回条目的 box 坐标把文字分回各自的来源帧。
+    拼图只纵向排列，块之间留 gap 像素的空白，避免 OCR 把相邻块的文字连成一行。
+    box 跨越多个块或落在空白处时无法判断归属，相关的块改为单独请求。
+
+    submit() 与 OCRClient.submit() 用法相同，可以直接传给 ocr_in_order()。
+    """
+
+    def __init__(self, client, batch_size=8, max_width=1600, max_height=2400, gap=24,
+                 flush_interval=0.2, background=255):
+        self.client = client
+        self.batch_size = batch_size
+        self.max_width = max_width
+        self.max_height = max_height
+        self.gap = gap
+        self.flush_interval = flush_interval
+        self.background = background
+        # ocr_in_order 按这个窗口限制在途数量，需要容纳多个未满的批次
+        self.max_in_flight = batch_size * client.max_in_flight
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.mosaic_requests = 0
+        self.fallback_tiles = 0
+        self.closed = False
+        self.flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def submit(self, image, lang="eng", frame_hash=None):
+        cache_key, texts = self.client.lookup_cached(frame_hash, lang)
+        future = Future()
+        if texts is not None:
+            future.set_result(texts)
+            return future
+
+        tile = _Tile(image, frame_hash, cache_key, future)
+        # 太宽或太高的图放不进拼图，直接单独请求
+        if image.shape[1] > self.max_width or image.shape[0] > self.max_height:
+            self._send_single(tile, lang)
+            return future
+
+        to_send = []
+        with self.lock:
+            batch = self.pending.get(lang)
+            # 当前批次放不下这一块时先发出
+            if batch and batch["height"] + self.gap + image.shape[0] > self.max_height:
+                to_send.append(self.pending.pop(lang)["tiles"])
+                batch = None
+            if batch is None:
+                batch = self.pending[lang] = {"tiles": [], "height": -self.gap, "started": time.monotonic()}
+            batch["tiles"].append(tile)
+            batch["height"] += self.gap + image.shape[0]
+            if len(batch["tiles"]) >= self.batch_size:
+                to_send.append(self.pending.pop(lang)["tiles"])
+        for tiles in to_send:
+            self._send_batch(tiles, lang)
+        return future
+
+    def _flush_periodically(self):
+        while not self.closed:
+            time.sleep(self.flush_interval / 2)
+            self.flush(max_age=self.flush_interval)
+
+    # 发送等待时间超过 max_age 的未满批次；max_age=0 时全部发送
+    def flush(self, max_age=0):
+        now = time.monotonic()
+        with self.lock:
+            expired = [lang for lang, batch in self.pending.items() if now - batch["started"] >= max_age]
+            batches = [(lang, self.pending.pop(lang)["tiles"]) for lang in expired]
+        for lang, tiles in batches:
+            self._send_batch(tiles, lang)
+
+    # 结束一块的 Future；写缓存出错不影响识别结果
+    def _resolve(self, tile, texts):
+        if not isinstance(texts, OCRFailure):
+            try:
+                self.client.store_cached(tile.cache_key, texts)
+            except Exception as e:
+                print(f"Failed to cache OCR result: {e!r}")
+        tile.future.set_result(texts)
+
+    # 请求或回调出错时仍要结束每一块的 Future（按识别失败处理），否则 ocr_in_order 会一直等待
+    def _fail(self, tiles, error):
+        print(f"Mosaic OCR failed: {error!r}")
+        for tile in tiles:
+            if not tile.future.done():
+                tile.future.set_result(OCRFailure())
+
+    def _send_single(self, tile, lang):
+        def finish(done):
+            try:
+                texts = done.result()
+            except Exception as e:
+                self._fail([tile], e)
+                return
+            self._resolve(tile, texts)
+
+        try:
+            self.client.submit(encode_image(tile.image), lang).add_done_callback(finish)
+        except Exception as e:
+            self._fail([tile], e)
+
+    def _send_batch(self, tiles, lang):
+        if len(tiles) == 1:
+            self._send_single(tiles[0], lang)
+            return
+
+        try:
+            width = max(tile.image.shape[1] for tile in tiles)
+            height = sum(tile.image.shape[0] for tile in tiles) + self.gap * (len(tiles) - 1)
+            mosaic = np.full((height, width), self.background, dtype=np.uint8)
+            top = 0
+            for tile in tiles:
+                tile.top = top
+                image = tile.image if tile.image.ndim == 2 else tile.image.mean(axis=2).astype(np.uint8)
+                h, w = image.shape
+                mosaic[top:top + h, :w] = image
+                # 右侧空白延续块最右一列的像素，避免在块边缘产生多余的边
+                mosaic[top:top + h, w:] = image[:, -1:]
+                top += h + self.gap
+
+            with self.lock:
+                self.mosaic_requests += 1
+            self.client.submit_items(encode_image(mosaic), lang).add_done_callback(
+                lambda done: self._split_results(tiles, done, lang)
+            )
+        except Exception as e:
+            self._fail(tiles, e)
+
+    def _split_results(self, tiles, done, lang):
+        try:
+            texts, ambiguous = self._assign(tiles, done.result())
+        except Exception as e:
+            self._fail(tiles, e)
+            return
+        for index, tile in enumerate(tiles):
+            if index in ambiguous:
+                with self.lock:
+                    self.fallback_tiles += 1
+                self._send_single(tile, lang)
+            else:
+                self._resolve(tile, texts[index])
+
+    # 按 box 的纵向范围把条目分配到块，返回 (每块的文字, 无法确定归属、需要单独重试的块)
+    @staticmethod
+    def _assign(tiles, items):
+        texts = [[] for _ in tiles]
+        if items is None:
+            return texts, set(range(len(tiles)))
+        ambiguous = set()
+        for item in items:
+            box = item.get("box")
+            if not box:
+                return texts, set(range(len(tiles)))
+            ys = [point[1] for point in box]
+            y0, y1 = min(ys), max(ys)
+            overlapping = [
+                index for index, tile in enumerate(tiles)
+                if y0 < tile.top + tile.image.shape[0] and y1 > tile.top
+            ]
+            if len(overlapping) == 1:
+                texts[overlapping[0]].append(item["text"].strip())
+            elif overlapping:
+                ambiguous.update(overlapping)
+            else:
+                # 落在空白处，无法判断来自哪一块
+                return texts, set(range(len(tiles)))
+        return texts, ambiguous
+
+    def close(self):
+        self.flush()
+        self.closed = True
+
+    def report(self):
+        return f"Mosaic batching: {self.mosaic_requests} mosaic requests, {self.fallback_tiles} tiles resent individually"
@@ -1,46 +1,205 @@
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 import pandas as pd
+from 数据库 import SQLiteStore
 
-def move_folders_to_language_subfolders(excel_file):
+# 跨磁盘复制时每次读写的字节数
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+class MoveJournal(SQLiteStore):
     """
-    根据 Excel 文件中的信息，将文件夹移动到主文件夹下的对应语言子文件夹中。
-    
-    参数：
-    - excel_file: 包含文件夹语言分类的 Excel 文件路径。
+    文件夹移动日志：先写入全部计划，每一步开始和完成时更新状态，
+    中途退出后可以按日志继续或回滚，不需要重新读取 Excel 和扫描目录。
+
+    direction 为 forward（源 -> 目标）或 back（回滚，目标 -> 源）；
+    state: planned -> (copying -> copied ->) finished，失败为 failed，回滚时尚未开始的计划为 cancelled。
     """
-    # 读取 Excel 文件
-    df = pd.read_excel(excel_file)
 
-    # 遍历每一行，处理每个子文件夹
-    for _, row in df.iterrows():
-        base_folder = row["主文件夹"]
-        folder_name = row["子文件夹"]
-        detected_language = row["检测语言"]
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS moves (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source TEXT NOT NULL,
+        target TEXT NOT NULL,
+        direction TEXT NOT NULL DEFAULT 'forward',
+        method TEXT,
+        state TEXT NOT NULL DEFAULT 'planned',
+        error TEXT
+    );
+    """
+
+    def start(self, plan):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM moves")
+            conn.executemany("INSERT INTO moves (source, target) VALUES (?, ?)", plan)
+
+    def unfinished(self):
+        return self.connection().execute(
+            "SELECT id, source, target, direction, state FROM moves WHERE state NOT IN ('finished', 'failed', 'cancelled') ORDER BY id"
+        ).fetchall()
 
-        # 确定源文件夹路径
-        source_folder = os.path.join(base_folder, folder_name)
+    def set_state(self, move_id, state, method=None, error=None):
+        with self.connection() as conn:
+            conn.execute("UPDATE moves SET state = ?, method = COALESCE(?, method), error = ? WHERE id = ?",
+                         (state, method, error, move_id))
 
-        # 确定目标文件夹路径（语言子文件夹）
-        target_folder = os.path.join(base_folder, detected_language)
+    # 回滚：已开始的正向移动改为反向执行，尚未开始的取消；返回改为反向前的 (id, 源, 目标, 状态)
+    def reverse(self):
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, source, target, state FROM moves WHERE direction = 'forward' AND state NOT IN ('planned', 'cancelled')"
+            ).fetchall()
+            conn.execute("UPDATE moves SET state = 'cancelled' WHERE direction = 'forward' AND state = 'planned'")
+            conn.execute("UPDATE moves SET direction = 'back', state = 'planned', error = NULL "
+                         "WHERE direction = 'forward' AND state != 'cancelled'")
+        return rows
+
+    def summary(self):
+        rows = self.connection().execute(
+            "SELECT direction, state, COALESCE(method, ''), COUNT(*) FROM moves GROUP BY 1, 2, 3 ORDER BY 1, 2, 3"
+        ).fetchall()
+        return ", ".join(f"{direction}/{state}{'/' + method if method else ''}: {count}"
+                         for direction, state, method, count in rows)
+
+
+def _copy_file(source, target):
+    """大缓冲区复制单个文件，保留修改时间等属性"""
+    with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst, COPY_BUFFER_SIZE)
+    shutil.copystat(source, target)
+    return target
+
+
+def _same_device(path, other):
+    return os.stat(path).st_dev == os.stat(other).st_dev
+
+
+def _run_move(journal, move_id, source, target, state):
+    """
+    执行（或从中断处继续）一次移动。同一磁盘上直接改名，原子完成；
+    跨磁盘时先复制到 target.partial，整体改名为 target 后再删除源文件夹。
+    """
+    partial = f"{target}.partial"
+    if state == "copying" and os.path.exists(partial):
+        shutil.rmtree(partial)  # 上次中断留下的不完整副本
+    if state != "copied":
+        if os.path.exists(target):
+            if not os.path.exists(source):  # 改名已经完成，只是没来得及记录
+                journal.set_state(move_id, "finished")
+                return "rename"
+            raise FileExistsError(f"目标文件夹已存在: {target}")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if _same_device(source, os.path.dirname(target)):
+            os.rename(source, target)
+            journal.set_state(move_id, "finished", "rename")
+            return "rename"
+        journal.set_state(move_id, "copying", "copy")
+        shutil.copytree(source, partial, copy_function=_copy_file)
+        os.rename(partial, target)
+        journal.set_state(move_id, "copied")
+    if os.path.exists(source):
+        shutil.rmtree(source)
+    journal.set_state(move_id, "finished")
+    return "copy"
 
+
+# 把检测结果转成语言子文件夹名；空值、"."/".." 或含路径分隔符的结果不能作为一层子文件夹，返回 None
+def _language_folder(detected_language):
+    if not isinstance(detected_language, str) and pd.isna(detected_language):
+        return None
+    name = str(detected_language).strip()
+    if name in ("", ".", "..") or any(sep in name for sep in ("/", "\\")):
+        return None
+    return name
+
+
+def plan_moves(excel_file):
+    """根据 Excel 中的语言分类生成 (源文件夹, 目标文件夹) 计划，跳过不存在、已在目标位置或目标已存在的文件夹"""
+    df = pd.read_excel(excel_file)
+    plan = []
+    planned = set()
+    for base_folder, folder_name, detected_language in zip(df["主文件夹"], df["子文件夹"], df["检测语言"]):
+        # 确定源文件夹路径和目标文件夹路径（语言子文件夹）
+        source_folder = os.path.abspath(os.path.join(base_folder, str(folder_name)))
+        language = _language_folder(detected_language)
+        if language is None:
+            print(f"警告: {source_folder} 的检测语言 {detected_language!r} 无效，跳过。")
+            continue
+        target_path = os.path.abspath(os.path.join(base_folder, language, str(folder_name)))
+
+        if source_folder in planned or source_folder == target_path:
+            continue
         # 检查源文件夹是否存在
         if not os.path.exists(source_folder):
             print(f"警告: 源文件夹 {source_folder} 不存在，跳过。")
             continue
+        if os.path.exists(target_path):
+            print(f"警告: 目标文件夹 {target_path} 已存在，跳过。")
+            continue
+        planned.add(source_folder)
+        plan.append((source_folder, target_path))
+    return plan
+
 
-        # 如果目标语言子文件夹不存在，创建它
-        if not os.path.exists(target_folder):
-            os.makedirs(target_folder)
-            print(f"创建了目标语言文件夹: {target_folder}")
+def move_folders_to_language_subfolders(excel_file, journal_path=None, copy_workers=4, rollback=False):
+    """
+    根据 Excel 文件中的信息，将文件夹移动到主文件夹下的对应语言子文件夹中。
 
-        # 移动文件夹到目标语言子文件夹中
-        target_path = os.path.join(target_folder, folder_name)
+    参数：
+    - excel_file: 包含文件夹语言分类的 Excel 文件路径。
+    - journal_path: 移动日志（SQLite），默认与 Excel 同名的 _moves.db。上次运行未完成时直接按日志继续。
+    - copy_workers: 跨磁盘复制的并发数；同一磁盘上的改名在主线程中完成。
+    - rollback: 按日志把已移动的文件夹移回原位置。
+    """
+    journal_path = journal_path or Path(excel_file).with_name(f"{Path(excel_file).stem}_moves.db")
+    journal = MoveJournal(journal_path)
+
+    if rollback:
+        for move_id, source, target, state in journal.reverse():
+            # 清理正向移动留下的中间状态：不完整的副本，或复制完成后未删除完的源文件夹
+            if state in ("copying", "failed") and os.path.exists(f"{target}.partial"):
+                shutil.rmtree(f"{target}.partial")
+            elif state == "copied" and os.path.exists(source):
+                shutil.rmtree(source)
+        print("开始回滚")
+    elif journal.unfinished():
+        print(f"继续上次未完成的移动（日志: {journal_path}）")
+    else:
+        journal.start(plan_moves(excel_file))
+
+    moves = journal.unfinished()
+    print(f"待执行: {len(moves)} 个文件夹")
+    copies = []
+    for move_id, source, target, direction, state in moves:
+        if direction == "back":
+            source, target = target, source
+        # 同一磁盘先在主线程中直接改名，跨磁盘的复制交给线程池
+        if state in ("planned", "copying") and os.path.exists(source) and not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not _same_device(source, os.path.dirname(target)):
+                copies.append((move_id, source, target, state))
+                continue
         try:
-            shutil.move(source_folder, target_path)
-            print(f"已移动文件夹: {source_folder} -> {target_path}")
+            _run_move(journal, move_id, source, target, state)
+            print(f"已移动文件夹: {source} -> {target}")
         except Exception as e:
-            print(f"错误: 移动文件夹 {source_folder} 到 {target_path} 时失败 - {e}")
+            journal.set_state(move_id, "failed", error=str(e))
+            print(f"错误: 移动文件夹 {source} 到 {target} 时失败 - {e}")
+
+    with ThreadPoolExecutor(max_workers=copy_workers) as pool:
+        futures = {pool.submit(_run_move, journal, *move): move for move in copies}
+        for future in as_completed(futures):
+            move_id, source, target, _ = futures[future]
+            try:
+                future.result()
+                print(f"已复制并移动文件夹: {source} -> {target}")
+            except Exception as e:
+                journal.set_state(move_id, "failed", error=str(e))
+                print(f"错误: 复制文件夹 {source} 到 {target} 时失败 - {e}")
+
+    print(f"完成: {journal.summary()}")
 
 # 主程序
 if __name__ == "__main__":
@@ -0,0 +1,27 @@
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """
+    多线程共用的 SQLite 存储：每个线程一个连接，WAL 模式允许读写并发，
+    多个线程或进程同时写入时由 busy timeout 排队等待。子类通过 SCHEMA 定义表结构。
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, db_path, timeout=30):
+        self.db_path = str(db_path)
+        self.timeout = timeout
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
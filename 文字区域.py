@@ -0,0 +1,81 @@
+import base64
+import cv2
+import numpy as np
+
+
+def find_text_regions(frame, min_gradient=40, min_height=8, max_height_ratio=0.25, min_aspect=1.5, min_fill=0.2):
+    """
+    用边缘密度找候选文字行，返回 [(x, y, w, h), ...]（按从上到下排序）。
+    形态学梯度 + 阈值得到笔画边缘，横向闭运算把同一行的字符连成一块，
+    再按高度、宽高比和边缘填充率过滤连通域。
+    """
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, kernel)
+    otsu, _ = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    _, edges = cv2.threshold(gradient, max(otsu, min_gradient), 255, cv2.THRESH_BINARY)
+
+    line_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, width // 40), 1))
+    connected = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, line_kernel)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(connected, connectivity=8)
+    if count <= 1:
+        return []
+
+    # 每个连通域内的边缘像素占比
+    edge_pixels = np.bincount(labels.ravel(), weights=(edges > 0).ravel(), minlength=count)
+    x, y, w, h, area = stats[1:].T
+    fill = edge_pixels[1:] / (w * h)
+    keep = (h >= min_height) & (h <= height * max_height_ratio) & (w >= h * min_aspect) & (fill >= min_fill)
+    regions = [tuple(int(v) for v in box) for box in stats[1:][keep][:, :4]]
+    return sorted(regions, key=lambda box: (box[1], box[0]))
+
+
+# 裁出文字区域，灰度化后纵向拼接，并把行高缩放到不超过 max_line_height
+def crop_text_regions(frame, regions, padding=4, max_line_height=48):
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    crops = []
+    for x, y, w, h in regions:
+        x0, y0 = max(0, x - padding), max(0, y - padding)
+        x1, y1 = min(width, x + w + padding), min(height, y + h + padding)
+        crops.append(gray[y0:y1, x0:x1])
+
+    background = int(np.median(gray))
+    canvas_width = max(crop.shape[1] for crop in crops)
+    rows = []
+    for crop in crops:
+        row = np.full((crop.shape[0] + padding, canvas_width), background, dtype=np.uint8)
+        row[:crop.shape[0], :crop.shape[1]] = crop
+        rows.append(row)
+    stacked = np.vstack(rows)
+
+    line_height = float(np.median([h for _, _, _, h in regions]))
+    scale = min(1.0, max_line_height / line_height)
+    if scale < 1.0:
+        stacked = cv2.resize(stacked, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return stacked
+
+
+# 生成发送给 OCR 的图片：只保留文字区域；没有候选文字区域时返回 None，不发送
+def shrink_for_ocr(frame):
+    regions = find_text_regions(frame)
+    if not regions:
+        return None
+    return crop_text_regions(frame, regions)
+
+
+def encode_image(image, quality=85):
+    retval, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not retval:
+        return None
+    return base64.b64encode(buffer).decode("utf-8")
+
+
+# 帧 -> base64；crop_text=False 时发送完整帧
+def encode_for_ocr(frame, crop_text=True):
+    if crop_text:
+        frame = shrink_for_ocr(frame)
+        if frame is None:
+            return None
+    return encode_image(frame)
@@ -0,0 +1,221 @@
+import argparse
+import os
+import re
+import time
+from pathlib import Path
+from 数据库 import SQLiteStore
+
+HEADER = "Results for "
+# 中日文字之间没有空格，逐字切开作为单独的词元，短语查询时相邻的字即可匹配
+_CJK = re.compile(r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])")
+
+
+def normalize_text(text):
+    """写入和查询共用的规整：CJK 字符前后加空格；大小写和变音符号由 unicode61 分词器统一"""
+    return _CJK.sub(r" \1 ", text)
+
+
+class TextSearchIndex(SQLiteStore):
+    """
+    识别文字的全文索引（SQLite FTS5）：每行文字对应 (文件夹, 视频, 时间戳)，支持短语和前缀查询。
+    原文只保存在 lines 表中，FTS 表不保存内容（content=''），只保存倒排索引。
+    视频识别完成时由 save_video_result 增量写入；已有的结果库、Excel 和 Results for 文本可以用 index_* 补录。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS videos (
+        id INTEGER PRIMARY KEY,
+        folder TEXT NOT NULL,
+        video TEXT NOT NULL,
+        source TEXT,
+        UNIQUE (folder, video)
+    );
+    CREATE INDEX IF NOT EXISTS videos_source ON videos (source);
+    CREATE TABLE IF NOT EXISTS lines (
+        id INTEGER PRIMARY KEY,
+        video_id INTEGER NOT NULL,
+        timestamp REAL,
+        text TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS lines_video ON lines (video_id);
+    CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(
+        text, content='', tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TABLE IF NOT EXISTS sources (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        position INTEGER NOT NULL DEFAULT 0
+    );
+    """
+
+    # 无内容的 FTS 表需要提供原来写入的内容才能删除
+    def _delete_videos(self, conn, video_ids):
+        for video_id in video_ids:
+            rows = conn.execute("SELECT id, text FROM lines WHERE video_id = ?", (video_id,)).fetchall()
+            conn.executemany("INSERT INTO lines_fts (lines_fts, rowid, text) VALUES ('delete', ?, ?)",
+                             [(row_id, normalize_text(text)) for row_id, text in rows])
+            conn.execute("DELETE FROM lines WHERE video_id = ?", (video_id,))
+            conn.execute("DELETE FROM videos WHERE id = ?", (video_id,))
+
+    # 新建视频记录，替换同一 (文件夹, 视频) 已有的记录；replace=False 且已有记录时返回 None
+    def _new_video(self, conn, folder, video, source, replace=True):
+        row = conn.execute("SELECT id FROM videos WHERE folder = ? AND video = ?", (folder, video)).fetchone()
+        if row is not None:
+            if not replace:
+                return None
+            self._delete_videos(conn, [row[0]])
+        return conn.execute("INSERT INTO videos (folder, video, source) VALUES (?, ?, ?)",
+                            (folder, video, source)).lastrowid
+
+    # lines: [(时间戳, 文字)]
+    def _insert_lines(self, conn, video_id, lines):
+        for timestamp, text in lines:
+            row_id = conn.execute("INSERT INTO lines (video_id, timestamp, text) VALUES (?, ?, ?)",
+                                  (video_id, timestamp, text)).lastrowid
+            conn.execute("INSERT INTO lines_fts (rowid, text) VALUES (?, ?)", (row_id, normalize_text(text)))
+
+    def add_video(self, folder, video, texts, timestamps=None, source=None, replace=True):
+        """
+        写入一个视频的识别文字，timestamps 与 texts 一一对应（复用近似重复视频的文字时没有时间戳）。
+        replace=True 时替换该视频已有的记录；replace=False 时已有记录的视频跳过（补录旧结果时使用）。
+        """
+        timestamps = timestamps if timestamps is not None and len(timestamps) == len(texts) else [None] * len(texts)
+        with self.connection() as conn:
+            video_id = self._new_video(conn, str(folder), str(video), source, replace)
+            if video_id is None:
+                return False
+            self._insert_lines(conn, video_id, [(timestamp, text.strip()) for timestamp, text in zip(timestamps, texts)
+                                                if text.strip()])
+        return True
+
+    def _source_state(self, path):
+        row = self.connection().execute("SELECT size, mtime_ns, position FROM sources WHERE path = ?", (path,)).fetchone()
+        return row or (None, None, 0)
+
+    def _set_source(self, conn, path, position=0):
+        stat = os.stat(path)
+        conn.execute("INSERT OR REPLACE INTO sources (path, size, mtime_ns, position) VALUES (?, ?, ?, ?)",
+                     (path, stat.st_size, stat.st_mtime_ns, position))
+
+    def index_text_file(self, path, folder=None):
+        """
+        补录 Results for <视频>: 格式的文本（Umi_orc 的输出、文档切割的批次、汇总文档），每行文字一条记录。
+        文件没有变化时跳过；变化时替换这个文件之前写入的记录。返回写入的行数。
+        """
+        path = str(Path(path).resolve())
+        stat = os.stat(path)
+        size, mtime_ns, _ = self._source_state(path)
+        if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            return 0
+        folder = folder or Path(path).stem
+        count = 0
+        with self.connection() as conn, open(path, "r", encoding="utf-8", errors="replace") as file:
+            self._delete_videos(conn, [video_id for video_id, in conn.execute(
+                "SELECT id FROM videos WHERE source = ?", (path,)).fetchall()])
+            video_ids = {}  # 同一视频被追加多次时合并到一条视频记录
+            video_id = None
+            for line in file:
+                text = line.strip()
+                if line.startswith(HEADER):
+                    video = text[len(HEADER):].rstrip(":")
+                    video_id = video_ids.get(video)
+                    if video_id is None:
+                        video_id = video_ids[video] = self._new_video(conn, folder, video, path)
+                elif text and video_id is not None:
+                    self._insert_lines(conn, video_id, [(None, text)])
+                    count += 1
+            self._set_source(conn, path)
+        return count
+
+    def index_result_store(self, folder, result_store):
+        """补录文件夹结果库（结果存储.ResultStore）中上次之后新增的视频，已经索引过的视频跳过"""
+        path = str(Path(result_store.db_path).resolve())
+        _, _, position = self._source_state(path)
+        rows = result_store.connection().execute(
+            "SELECT id, video, content FROM results WHERE id > ? ORDER BY id", (position,)
+        ).fetchall()
+        count = 0
+        for _, video, content in rows:
+            count += self.add_video(folder, video, [content], source=path, replace=False)
+        if rows:
+            with self.connection() as conn:
+                self._set_source(conn, path, rows[-1][0])
+        return count
+
+    def index_folders(self, base_folder):
+        """补录 base_folder 下每个子文件夹的 <子文件夹>_识别结果（.db 结果库，旧版只有 .xlsx 时先导入）"""
+        from 结果存储 import open_result_store
+        count = 0
+        for subfolder in sorted(Path(base_folder).iterdir()):
+            output_file = subfolder / f"{subfolder.name}_识别结果.xlsx"
+            if subfolder.is_dir() and (output_file.exists() or output_file.with_suffix(".db").exists()):
+                count += self.index_result_store(subfolder.name, open_result_store(output_file))
+        return count
+
+    def search(self, query, prefix=False, folder=None, limit=20, raw=False, rank=False):
+        """
+        短语查询：query 中的词按顺序相邻出现（不区分大小写和变音符号）；prefix=True 时最后一个词按前缀匹配。
+        raw=True 时 query 直接作为 FTS5 查询表达式（AND / OR / NOT / NEAR 等）。
+        返回 (文件夹, 视频, 时间戳, 文字)，默认最近写入的在前，取够 limit 条即停止；
+        rank=True 时按相关度（bm25）排序，需要为所有匹配的行打分，常见词会慢很多。
+        """
+        if raw:
+            expression = query
+        else:
+            phrase = normalize_text(query).replace('"', '""')
+            if not re.search(r"\w", phrase):
+                return []
+            expression = f'"{phrase}"' + (" *" if prefix else "")
+        sql = ("SELECT videos.folder, videos.video, lines.timestamp, lines.text FROM lines_fts "
+               "JOIN lines ON lines.id = lines_fts.rowid JOIN videos ON videos.id = lines.video_id "
+               "WHERE lines_fts MATCH ?")
+        params = [expression]
+        if folder is not None:
+            sql += " AND videos.folder = ?"
+            params.append(str(folder))
+        sql += " ORDER BY lines_fts.rank LIMIT ?" if rank else " ORDER BY lines_fts.rowid DESC LIMIT ?"
+        params.append(limit)
+        return self.connection().execute(sql, params).fetchall()
+
+    def count(self):
+        return self.connection().execute("SELECT COUNT(*) FROM lines").fetchone()[0]
+
+    def optimize(self):
+        """合并 FTS 的索引段，大量写入之后执行可以减小文件并加快查询"""
+        with self.connection() as conn:
+            conn.execute("INSERT INTO lines_fts (lines_fts) VALUES ('optimize')")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="识别文字全文索引：补录已有结果，按短语或前缀查询")
+    parser.add_argument("--db", default="video_texts.db", help="索引文件")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_parser = commands.add_parser("index", help="补录已有的识别结果")
+    index_parser.add_argument("--folders", nargs="*", default=[], help="包含 <子文件夹>_识别结果 的主文件夹")
+    index_parser.add_argument("--text-files", nargs="*", default=[], help="Results for ... 格式的文本文件")
+    search_parser = commands.add_parser("search", help="查询包含短语的视频")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--prefix", action="store_true", help="最后一个词按前缀匹配")
+    search_parser.add_argument("--raw", action="store_true", help="query 为 FTS5 查询表达式")
+    search_parser.add_argument("--folder", help="只查询这个文件夹")
+    search_parser.add_argument("--limit", type=int, default=20)
+    search_parser.add_argument("--rank", action="store_true", help="按相关度排序（默认最近写入的在前）")
+    args = parser.parse_args()
+
+    index = TextSearchIndex(args.db)
+    if args.command == "index":
+        for base_folder in args.folders:
+            print(f"{base_folder}: indexed {index.index_folders(base_folder)} videos")
+        for text_file in args.text_files:
+            print(f"{text_file}: indexed {index.index_text_file(text_file)} lines")
+        index.optimize()
+        print(f"{index.count()} lines in {args.db}")
+    else:
+        start = time.perf_counter()
+        results = index.search(args.query, args.prefix, args.folder, args.limit, args.raw, args.rank)
+        elapsed = time.perf_counter() - start
+        for folder, video, timestamp, text in results:
+            at = f" @ {timestamp:.1f}s" if timestamp is not None else ""
+            print(f"{folder}/{video}{at}: {text}")
+        print(f"{len(results)} results in {elapsed * 1000:.1f} ms")
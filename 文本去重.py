@@ -0,0 +1,109 @@
+import math
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+
+# 用于计算字符串相似性
+def similar(a, b):
+    return SequenceMatcher(None, a, b).ratio()
+
+
+# 多重集合的元素：(词元, 第几次出现)，两个多重集合共有的元素数即交集的大小
+def _elements(tokens):
+    seen = Counter()
+    elements = []
+    for token in tokens:
+        elements.append((token, seen[token]))
+        seen[token] += 1
+    return elements
+
+
+# 字符二元组（多重集合，重复出现的二元组按出现次数区分）
+def _bigrams(text):
+    if len(text) < 2:
+        return frozenset(_elements([text]))
+    return frozenset(_elements(text[i:i + 2] for i in range(len(text) - 1)))
+
+
+class NearDuplicateIndex:
+    """
+    近似重复文本检测，结果与 any(similar(text, t) > threshold for t in texts) 完全一致。
+
+    similar() 的 ratio = 2M / (la + lb)，M 是匹配块的总长度。对 threshold >= 0.8：
+    - 长度过滤：M <= min(la, lb)，长度相差过大的文本不可能超过阈值；
+    - 字符过滤：匹配的字符都是共有字符，共有字符数 >= M > threshold * (la + lb) / 2（即 quick_ratio）；
+    - 计数过滤：相邻匹配块之间至少隔一个未匹配字符，块数 k <= la + lb - 2M + 1，
+      因此两者共有的二元组至少有 M - k >= 3M - la - lb - 1 个。
+    候选由前缀过滤产生：字符过滤代入长度过滤给出的 lb 下界，可能重复的文本至少共有 τ 个字符。
+    倒排索引的键是 (字符, 第几次出现)，新文本的这些元素按倒排列表从短到长排列，只需访问前 la - τ + 1 个：
+    共有 τ 个以上字符的文本必然出现在其中，最常见的元素不再遍历。各道过滤都通过后才调用 SequenceMatcher。
+    """
+
+    def __init__(self, threshold=0.8):
+        if threshold < 0.8:
+            # 阈值过低时计数过滤不再成立，相似文本可能没有任何共同二元组
+            raise ValueError("NearDuplicateIndex requires threshold >= 0.8")
+        self.threshold = threshold
+        self.texts = []
+        self.chars = []
+        self.grams = []
+        self.postings = defaultdict(list)  # (字符, 第几次出现) -> 文本编号
+        self.exact = {}
+
+    def _is_candidate(self, la, lb, shared):
+        total = la + lb
+        if 2 * min(la, lb) <= self.threshold * total:
+            return False
+        # M > threshold * total / 2，代入 M - k 的下界
+        min_match = self.threshold * total / 2
+        return shared > 3 * min_match - total - 1
+
+    # 长度为 la 的文本与任何可能重复的文本至少共有的字符数
+    def _min_shared_chars(self, la):
+        t = self.threshold
+        return max(1, math.floor(t * (la + t * la / (2 - t)) / 2))
+
+    # 是否已存在与 text 相似度超过阈值的文本
+    def find(self, text):
+        if text in self.exact:
+            return True
+        la = len(text)
+        chars = _elements(text)
+        prefix = max(0, la - self._min_shared_chars(la) + 1)
+        shared = Counter()
+        for element in sorted(chars, key=lambda element: len(self.postings.get(element, ())))[:prefix]:
+            shared.update(self.postings.get(element, ()))
+        remaining = la - prefix  # 没有访问的元素最多再贡献的共有字符数
+
+        chars = frozenset(chars)
+        grams = _bigrams(text)
+        min_ratio = self.threshold / 2
+        # 共有字符越多越可能重复，先检查
+        for index, count in shared.most_common():
+            recorded_text = self.texts[index]
+            total = la + len(recorded_text)
+            if count + remaining <= min_ratio * total or len(chars & self.chars[index]) <= min_ratio * total:
+                continue
+            shared_grams = len(grams & self.grams[index])
+            if not shared_grams or not self._is_candidate(la, len(recorded_text), shared_grams):
+                continue
+            if SequenceMatcher(None, text, recorded_text).ratio() > self.threshold:
+                return True
+        return False
+
+    def add(self, text):
+        index = len(self.texts)
+        chars = _elements(text)
+        self.texts.append(text)
+        self.chars.append(frozenset(chars))
+        self.grams.append(_bigrams(text))
+        self.exact[text] = index
+        for element in chars:
+            self.postings[element].append(index)
+
+    # 没有相似文本时加入索引并返回 True
+    def add_if_new(self, text):
+        if self.find(text):
+            return False
+        self.add(text)
+        return True
@@ -0,0 +1,63 @@
+import argparse
+import random
+import string
+import time
+from 文本去重 import NearDuplicateIndex, similar
+
+WORDS = (
+    "you what when he she said never been with before have love this that one girl "
+    "home plays dress up all day wants stays likes animals more than legs which "
+    "retired horse redhead me my the a and is are was were to of in on for it"
+).split()
+
+
+# 模拟 OCR 字幕：每句字幕在相邻几帧中重复出现，并带有少量识别错误
+def generate_ocr_lines(count, repeats=(2, 6), seed=0):
+    rng = random.Random(seed)
+    lines = []
+    while len(lines) < count:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 9)))
+        for _ in range(rng.randint(*repeats)):
+            chars = list(sentence)
+            for _ in range(rng.randint(0, 2)):
+                chars[rng.randrange(len(chars))] = rng.choice(string.ascii_letters)
+            lines.append("".join(chars))
+    return lines[:count]
+
+
+# 现有实现：与所有已记录文本逐一比较
+def dedup_with_similar(lines, threshold=0.8):
+    extracted_texts = []
+    for text in lines:
+        if not any(similar(text, recorded_text) > threshold for recorded_text in extracted_texts):
+            extracted_texts.append(text)
+    return extracted_texts
+
+
+def dedup_with_index(lines, threshold=0.8):
+    text_index = NearDuplicateIndex(threshold)
+    return [text for text in lines if text_index.add_if_new(text)]
+
+
+def run(sizes):
+    for size in sizes:
+        lines = generate_ocr_lines(size)
+
+        start = time.perf_counter()
+        expected = dedup_with_similar(lines)
+        baseline = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = dedup_with_index(lines)
+        indexed = time.perf_counter() - start
+
+        assert result == expected, "NearDuplicateIndex 与 similar() 的结果不一致"
+        print(f"{size} 行 -> {len(result)} 条唯一文本 | similar(): {baseline:.3f}s | "
+              f"NearDuplicateIndex: {indexed:.3f}s | 加速 {baseline / indexed:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比 similar() 逐一比较与 NearDuplicateIndex 的去重耗时")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+    run(args.sizes)
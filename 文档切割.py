@@ -1,36 +1,221 @@
+import argparse
+import hashlib
+import mmap
 import os
+from 数据库 import SQLiteStore
 
-def split_document(input_file_path, output_dir):
-    with open(input_file_path, 'r', encoding='latin1') as file:
-        lines = file.readlines()
+HEADER = b"Results for "
+# 复制批次内容时每次读写的字节数
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+# 校验索引时比较的文件尾部长度
+TAIL_CHECK_SIZE = 64 * 1024
+# UTF-8 多字节字符的首字节，每个非 ASCII 字符大约算一个 token
+_LEAD_BYTES = bytes(range(0xC0, 0x100))
 
-    batch_size = 10
+
+def estimate_tokens(data):
+    """粗略估计 token 数：按空白切分的片段数 + 非 ASCII 字符数"""
+    return len(data.split()) + len(data) - len(data.translate(None, _LEAD_BYTES))
+
+
+def _tail_hash(path, size):
+    with open(path, "rb") as f:
+        f.seek(max(0, size - TAIL_CHECK_SIZE))
+        return hashlib.blake2b(f.read(min(size, TAIL_CHECK_SIZE)), digest_size=16).hexdigest()
+
+
+class RecordIndex(SQLiteStore):
+    """
+    汇总结果文件的旁路索引（<文件名>.idx.db）：记录每条 "Results for <视频>:" 记录的字节偏移、长度和估计 token 数，
+    按视频名或序号读取时只需一次 seek。结果文件只在末尾追加时增量更新索引，其他修改会重建。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS records (
+        seq INTEGER PRIMARY KEY,
+        video TEXT NOT NULL,
+        offset INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        tokens INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS records_video ON records (video);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, input_file_path):
+        self.input_file_path = str(input_file_path)
+        super().__init__(f"{self.input_file_path}.idx.db")
+
+    def _meta(self):
+        return dict(self.connection().execute("SELECT key, value FROM meta").fetchall())
+
+    def update(self):
+        """扫描结果文件中新增的部分；返回新增的记录数"""
+        stat = os.stat(self.input_file_path)
+        meta = self._meta()
+        conn = self.connection()
+        if meta.get("mtime_ns") == str(stat.st_mtime_ns) and meta.get("size") == str(stat.st_size):
+            return 0
+
+        start = 0
+        old_size = int(meta.get("size", 0))
+        # 只有末尾追加时才能增量扫描：原有部分的结尾没有变化，最后一条记录可能变长，从它开始重新扫描
+        if meta and stat.st_size >= old_size and _tail_hash(self.input_file_path, old_size) == meta.get("tail_hash"):
+            row = conn.execute("SELECT seq, offset FROM records ORDER BY seq DESC LIMIT 1").fetchone()
+            if row is not None:
+                start = row[1]
+                with conn:
+                    conn.execute("DELETE FROM records WHERE seq = ?", row[:1])
+        else:
+            with conn:
+                conn.execute("DELETE FROM records")
+
+        added = 0
+        if stat.st_size:
+            with open(self.input_file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with conn:
+                    batch = []
+                    for row in self._scan(mm, start):
+                        batch.append(row)
+                        if len(batch) >= 10000:
+                            conn.executemany("INSERT INTO records (video, offset, length, tokens) VALUES (?, ?, ?, ?)", batch)
+                            added += len(batch)
+                            batch = []
+                    conn.executemany("INSERT INTO records (video, offset, length, tokens) VALUES (?, ?, ?, ?)", batch)
+                    added += len(batch)
+
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                ("size", str(stat.st_size)),
+                ("mtime_ns", str(stat.st_mtime_ns)),
+                ("tail_hash", _tail_hash(self.input_file_path, stat.st_size)),
+            ])
+        return added
+
+    # 从 start（某条记录的开头或 0）开始，生成 (视频名, 偏移, 长度, 估计 token 数)
+    @staticmethod
+    def _scan(mm, start):
+        size = len(mm)
+        # start 处或之后第一个位于行首的 "Results for "
+        if mm[start:start + len(HEADER)] == HEADER and (start == 0 or mm[start - 1] == ord("\n")):
+            header = start
+        else:
+            found = mm.find(b"\n" + HEADER, start)
+            header = found + 1 if found >= 0 else -1
+        while header >= 0:
+            following = mm.find(b"\n" + HEADER, header)
+            end = size if following < 0 else following + 1
+            line_end = mm.find(b"\n", header, end)
+            name = mm[header + len(HEADER):line_end if line_end >= 0 else end].rstrip(b"\r").rstrip(b":")
+            yield (name.decode("utf-8", errors="replace"), header, end - header,
+                   estimate_tokens(mm[header:end]))
+            header = end if following >= 0 else -1
+
+    def count(self):
+        return self.connection().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def records(self, first_seq=None, last_seq=None):
+        """按顺序返回 (序号, 视频名, 偏移, 长度, 估计 token 数)"""
+        return self.connection().execute(
+            "SELECT seq, video, offset, length, tokens FROM records WHERE seq BETWEEN ? AND ? ORDER BY seq",
+            (first_seq if first_seq is not None else 0, last_seq if last_seq is not None else 2 ** 62),
+        )
+
+    def lookup(self, video):
+        """同一视频可能被追加多次，按出现顺序返回所有 (偏移, 长度)"""
+        return self.connection().execute(
+            "SELECT offset, length FROM records WHERE video = ? ORDER BY seq", (video,)
+        ).fetchall()
+
+    def read(self, offset, length):
+        with open(self.input_file_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8", errors="replace")
+
+    def read_range(self, first_seq, last_seq):
+        """读取序号从 first_seq 到 last_seq（含）的连续记录"""
+        row = self.connection().execute(
+            "SELECT MIN(offset), MAX(offset + length) FROM records WHERE seq BETWEEN ? AND ?", (first_seq, last_seq)
+        ).fetchone()
+        return self.read(row[0], row[1] - row[0]) if row[0] is not None else ""
+
+    def read_video(self, video):
+        """读取视频最近一次的识别结果，没有时返回 None"""
+        locations = self.lookup(video)
+        return self.read(*locations[-1]) if locations else None
+
+
+def open_index(input_file_path):
+    """打开结果文件的旁路索引，并扫描上次之后新增的内容"""
+    index = RecordIndex(input_file_path)
+    added = index.update()
+    if added:
+        print(f"Indexed {added} new records in {input_file_path}")
+    return index
+
+
+def plan_batches(index, batch_size=10, max_bytes=None, max_tokens=None):
+    """
+    按记录数和（可选的）字节数、token 数上限把记录分批，生成 (起始偏移, 结束偏移, 记录数)。
+    单条记录超过上限时单独成批；第一条记录之前的内容并入第一批。
+    """
+    start = end = count = size = tokens = 0
+    for seq, video, offset, length, record_tokens in index.records():
+        if count and ((batch_size and count >= batch_size)
+                      or (max_bytes and size + length > max_bytes)
+                      or (max_tokens and tokens + record_tokens > max_tokens)):
+            yield start, end, count
+            start, count, size, tokens = offset, 0, 0, 0
+        end = offset + length
+        count += 1
+        size += length
+        tokens += record_tokens
+    if count:
+        yield start, end, count
+
+
+def _copy_range(source, output_file_path, start, end):
+    source.seek(start)
+    remaining = end - start
+    with open(output_file_path, "wb") as output_file:
+        while remaining > 0:
+            chunk = source.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            output_file.write(chunk)
+            remaining -= len(chunk)
+
+
+def split_document(input_file_path, output_dir, batch_size=10, max_bytes=None, max_tokens=None):
+    """
+    按索引把结果文件切成 batch_<n>.txt：每批最多 batch_size 条记录，
+    并且（指定时）不超过 max_bytes 字节、max_tokens 个估计 token。
+    批次内容按字节原样复制，不经过解码，非 ASCII 文字保持不变。
+    """
+    index = open_index(input_file_path)
     os.makedirs(output_dir, exist_ok=True)
-    
-    video_count = 0
-    batch_lines = []
-    batch_index = 1
-
-    for line in lines:
-        if line.startswith("Results for"):
-            video_count += 1
-            if video_count > batch_size:
-                output_file_path = os.path.join(output_dir, f'batch_{batch_index}.txt')
-                with open(output_file_path, 'w', encoding='utf-8') as output_file:
-                    output_file.writelines(batch_lines)
-                print(f'Created {output_file_path}')
-                batch_lines = []
-                video_count = 1
-                batch_index += 1
-        batch_lines.append(line)
-    
-    if batch_lines:
-        output_file_path = os.path.join(output_dir, f'batch_{batch_index}.txt')
-        with open(output_file_path, 'w', encoding='utf-8') as output_file:
-            output_file.writelines(batch_lines)
-        print(f'Created {output_file_path}')
+    with open(input_file_path, "rb") as source:
+        for batch_index, (start, end, count) in enumerate(
+                plan_batches(index, batch_size, max_bytes, max_tokens), start=1):
+            output_file_path = os.path.join(output_dir, f'batch_{batch_index}.txt')
+            _copy_range(source, output_file_path, start, end)
+            print(f'Created {output_file_path} ({count} videos, {end - start} bytes)')
 
 if __name__ == '__main__':
-    input_file_path = 'unique_text_results_only.txt'
-    output_dir = 'batches'
-    split_document(input_file_path, output_dir)
+    parser = argparse.ArgumentParser(description="按视频记录切分汇总结果文件，或按视频名读取单条记录")
+    parser.add_argument("input_file", nargs="?", default='unique_text_results_only.txt')
+    parser.add_argument("--output-dir", default='batches')
+    parser.add_argument("--batch-size", type=int, default=10, help="每批最多的视频数，0 表示不限")
+    parser.add_argument("--max-bytes", type=int, help="每批最多的字节数")
+    parser.add_argument("--max-tokens", type=int, help="每批最多的估计 token 数")
+    parser.add_argument("--video", help="只输出这个视频的识别结果")
+    args = parser.parse_args()
+
+    if args.video:
+        text = open_index(args.input_file).read_video(args.video)
+        print(text if text is not None else f"{args.video} not found")
+    else:
+        split_document(args.input_file, args.output_dir, args.batch_size, args.max_bytes, args.max_tokens)
@@ -1,59 +1,123 @@
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from openpyxl import load_workbook
 from openpyxl.utils import column_index_from_string
 
+# 每个进程任务格式化的行数
+CHUNK_SIZE = 2000
+# 输出文件的写缓冲大小
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+SEPARATOR = "-" * 50  # 添加更长的分隔符
+
+
 def format_text_to_width(text, max_width=50):
     """
     格式化文本，每行最多 max_width 个字符，自动换行。
     """
-    words = text.split()
     lines = []
-    current_line = ""
-    for word in words:
-        if len(current_line) + len(word) + 1 > max_width:
-            lines.append(current_line)
-            current_line = word
-        else:
-            current_line += (" " + word if current_line else word)
-    if current_line:
-        lines.append(current_line)
+    current_words = []
+    current_length = -1  # 当前行的长度减去下一个单词前的空格
+    for word in text.split():
+        if current_words and current_length + len(word) + 1 > max_width:
+            lines.append(" ".join(current_words))
+            current_words = []
+            current_length = -1
+        current_words.append(word)
+        current_length += len(word) + 1
+    if current_words:
+        lines.append(" ".join(current_words))
     return "\n".join(lines)
 
-def extract_and_save_columns_to_txt(excel_file, output_txt_file, columns, max_line_length=50):
+
+def format_rows(rows, max_line_length=50):
+    """把一批行（已按 columns 取出的单元格值）格式化为一段文本；最后一列为空的行跳过"""
+    parts = []
+    for extracted_values in rows:
+        # 如果最后一列为空，跳过此行
+        if not extracted_values[-1]:
+            continue
+        # 格式化每个单元格内容，并添加空行
+        formatted_lines = []
+        for value in extracted_values:
+            if value:
+                formatted_lines.append(format_text_to_width(str(value), max_width=max_line_length))
+            formatted_lines.append("")  # 添加空行
+        formatted_lines = formatted_lines[:-1]  # 移除最后多余的空行
+        parts.append("\n".join(formatted_lines))
+        parts.append(f"\n{SEPARATOR}\n")
+    return "".join(parts)
+
+
+# 只读模式逐行读取，返回每 chunk_size 行一批的 [(列值, ...)]
+def _read_chunks(sheet, indexes, chunk_size):
+    max_col = max(indexes) + 1
+    chunk = []
+    for row in sheet.iter_rows(min_row=2, max_col=max_col, values_only=True):  # 从第二行开始读取，跳过标题行
+        if len(row) < max_col:
+            row = row + (None,) * (max_col - len(row))
+        chunk.append(tuple(row[index] for index in indexes))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def extract_and_save_columns_to_txt(excel_file, output_txt_file, columns, max_line_length=50,
+                                    chunk_size=CHUNK_SIZE, workers=None):
     """
     从 Excel 文件中提取指定列的内容，并保存为格式化的文本文件。
-    
+
+    工作簿以只读模式逐行读取，内存占用与行数无关；每 chunk_size 行交给进程池格式化，
+    按顺序写出，同时在途的批次不超过 2 * workers 个。workers=1 时在当前进程中格式化。
+
     :param excel_file: 输入的 Excel 文件路径
     :param output_txt_file: 输出的文本文件路径
     :param columns: 要提取的列的名称，例如 ["A", "C", "F"]
     :param max_line_length: 文本文档每行最大字符数
+    :param chunk_size: 每批格式化的行数
+    :param workers: 格式化进程数，默认为 CPU 核数
     """
-    workbook = load_workbook(excel_file)
-    sheet = workbook.active
-
-    with open(output_txt_file, "w", encoding="utf-8") as txt_file:
-        for row in sheet.iter_rows(min_row=2, values_only=True):  # 从第二行开始读取，跳过标题行
-            extracted_values = [row[column_index_from_string(col) - 1] for col in columns]
-            # 如果 F 列为空，跳过此行
-            if not extracted_values[-1]:  # 检查最后一列是否为空
-                continue
-            
-            # 格式化每个单元格内容，并添加空行
-            formatted_lines = []
-            for value in extracted_values:
-                if value:
-                    formatted_lines.append(format_text_to_width(str(value), max_width=max_line_length))
-                formatted_lines.append("")  # 添加空行
-            formatted_lines = formatted_lines[:-1]  # 移除最后多余的空行
-            
-            # 写入到文本文件
-            txt_file.write("\n".join(formatted_lines))
-            txt_file.write("\n" + "-" * 50 + "\n")  # 添加更长的分隔符
+    indexes = [column_index_from_string(col) - 1 for col in columns]
+    workbook = load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        chunks = _read_chunks(sheet, indexes, chunk_size)
+        with open(output_txt_file, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as txt_file:
+            if workers == 1:
+                for chunk in chunks:
+                    txt_file.write(format_rows(chunk, max_line_length))
+            else:
+                workers = workers or os.cpu_count()
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    window = 2 * workers
+                    pending = deque()
+                    for chunk in chunks:
+                        pending.append(pool.submit(format_rows, chunk, max_line_length))
+                        # 在途批次达到 window 时先写出最早的一批，读取也随之暂停
+                        if len(pending) >= window:
+                            txt_file.write(pending.popleft().result())
+                    for future in pending:
+                        txt_file.write(future.result())
+    finally:
+        workbook.close()
 
     print(f"提取完成，结果已保存到 {output_txt_file}")
 
+
 # 示例用法
-excel_file_path = r"\\ADMIN-20231023E\software\工作文件夹\项目代码\小说推文批量处理\Data\文本\总识别结果\总识别结果_模型整理文本_审核是否有性暗示\总识别结果_模型整理文本_审核是否有性暗示_模型转译.xlsx"  # 替换为您的 Excel 文件路径
-output_txt_file_path = r"data\24-11-26汇总文档.txt"  # 替换为您想保存的文本文件路径
-columns_to_extract = ["A", "C", "F"]  # 替换为您想提取的列名
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="提取 Excel 中指定列的内容，保存为格式化的文本文档")
+    parser.add_argument("excel_file", nargs="?",
+                        default=r"\\ADMIN-20231023E\software\工作文件夹\项目代码\小说推文批量处理\Data\文本\总识别结果\总识别结果_模型整理文本_审核是否有性暗示\总识别结果_模型整理文本_审核是否有性暗示_模型转译.xlsx")
+    parser.add_argument("output_txt_file", nargs="?", default=r"data\24-11-26汇总文档.txt")
+    parser.add_argument("--columns", nargs="+", default=["A", "C", "F"], help="要提取的列名")
+    parser.add_argument("--max-line-length", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, help="格式化进程数，默认为 CPU 核数")
+    args = parser.parse_args()
 
-extract_and_save_columns_to_txt(excel_file_path, output_txt_file_path, columns_to_extract)
+    extract_and_save_columns_to_txt(args.excel_file, args.output_txt_file, args.columns,
+                                    args.max_line_length, args.chunk_size, args.workers)
@@ -1,10 +1,14 @@
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from langdetect import detect, DetectorFactory
 from langdetect.lang_detect_exception import LangDetectException
 from collections import Counter
 from pathlib import Path
 import re
+import numpy as np
 import pandas as pd
+from tqdm import tqdm
+from 语言缓存 import LanguageCache
 
 # 设定随机种子，保证结果一致性
 DetectorFactory.seed = 0
@@ -19,35 +23,147 @@ def clean_filename(filename):
     filename = re.sub(r"[^\w\s]", "", filename)  # 去掉非字母数字和空格
     return filename.strip()
 
+# 规则判定用的关键词
+ARABIC_KEYWORDS = [
+    "السلام", "مرحبا", "شكرا", "الله", "محمد", "السعودية",
+    "إسلام", "قرآن", "مسلم", "جميل", "العربية", "اللغة"
+]
+SPANISH_KEYWORDS = [
+    "hola", "gracias", "por", "amigo", "buenos", "dias",
+    "mañana", "fiesta", "adiós", "familia", "feliz", "navidad"
+]
+PORTUGUESE_KEYWORDS = [
+    "obrigado", "oi", "de", "amigo", "bom", "dia",
+    "português", "feliz", "brasil", "carnaval", "gosto", "saúde"
+]
+# 快速判定额外使用的高频虚词；与英语拼写相同的词（如葡语 do）不收录
+ENGLISH_WORDS = [
+    "the", "and", "i", "you", "your", "is", "are", "was", "to", "of", "in", "that", "this", "what", "my", "me",
+    "with", "for", "it", "when", "he", "she", "have", "not", "so", "do", "just", "like", "be", "we", "they",
+    "but", "on", "at", "if", "i'm", "don't", "can", "will", "about", "how", "all", "who", "why", "one"
+]
+SPANISH_WORDS = [
+    "el", "la", "los", "las", "una", "pero", "muy", "y", "es", "del", "con", "qué", "que", "de", "para", "está",
+    "yo", "eso", "cuando", "tu", "mi"
+]
+PORTUGUESE_WORDS = [
+    "não", "você", "uma", "com", "os", "muito", "é", "da", "em", "eu", "isso", "que", "para", "quando",
+    "meu", "está"
+]
+
+# 与法语、意大利语拼写相同的词：快速判定不能据此认定西语或葡语，这些文本交给 langdetect
+ROMANCE_SHARED_WORDS = {
+    "es", "tu", "la", "de", "que", "mi", "y", "con", "una", "del", "da", "eu", "quando", "pero", "dia"
+}
+# 修改快速判定或检测规则时加一，语言缓存中旧版本的检测结果随之失效
+DETECTOR_VERSION = 1
+
+# 文字系统直方图的类别；西语 / 葡语 / 波斯语、乌尔都语的特征字符单独成类
+NEUTRAL, LATIN, LATIN_ACCENTED, ARABIC, OTHER_SCRIPT, SPANISH_MARK, PORTUGUESE_MARK, PERSIAN_MARK = range(8)
+# (起始码位, 类别)：每段一直延续到下一段的起始码位
+_SCRIPT_RANGES = [
+    (0x0, NEUTRAL), (0x41, LATIN), (0x5B, NEUTRAL), (0x61, LATIN), (0x7B, NEUTRAL),
+    (0xA1, SPANISH_MARK), (0xA2, NEUTRAL), (0xBF, SPANISH_MARK), (0xC0, LATIN_ACCENTED),
+    (0xC3, PORTUGUESE_MARK), (0xC4, LATIN_ACCENTED), (0xD1, SPANISH_MARK), (0xD2, LATIN_ACCENTED),
+    (0xD5, PORTUGUESE_MARK), (0xD6, LATIN_ACCENTED), (0xD7, NEUTRAL), (0xD8, LATIN_ACCENTED),
+    (0xE3, PORTUGUESE_MARK), (0xE4, LATIN_ACCENTED), (0xF1, SPANISH_MARK), (0xF2, LATIN_ACCENTED),
+    (0xF5, PORTUGUESE_MARK), (0xF6, LATIN_ACCENTED), (0xF7, NEUTRAL), (0xF8, LATIN_ACCENTED),
+    (0x250, OTHER_SCRIPT), (0x300, LATIN_ACCENTED), (0x370, OTHER_SCRIPT),
+    (0x600, ARABIC), (0x679, PERSIAN_MARK), (0x67A, ARABIC), (0x67E, PERSIAN_MARK), (0x67F, ARABIC),
+    (0x686, PERSIAN_MARK), (0x687, ARABIC), (0x688, PERSIAN_MARK), (0x689, ARABIC),
+    (0x691, PERSIAN_MARK), (0x692, ARABIC), (0x698, PERSIAN_MARK), (0x699, ARABIC),
+    (0x6AF, PERSIAN_MARK), (0x6B0, ARABIC), (0x6BA, PERSIAN_MARK), (0x6BB, ARABIC),
+    (0x6D2, PERSIAN_MARK), (0x6D3, ARABIC), (0x700, OTHER_SCRIPT), (0x750, ARABIC), (0x780, OTHER_SCRIPT),
+    (0x8A0, ARABIC), (0x900, OTHER_SCRIPT), (0x1E00, LATIN_ACCENTED), (0x1F00, OTHER_SCRIPT),
+    (0x2000, NEUTRAL), (0x2C00, OTHER_SCRIPT), (0x3000, NEUTRAL), (0x3040, OTHER_SCRIPT), (0xFB50, ARABIC), (0xFE00, NEUTRAL), (0xFE10, OTHER_SCRIPT),
+    (0xFE70, ARABIC), (0xFF00, OTHER_SCRIPT), (0x1F000, NEUTRAL), (0x1FB00, OTHER_SCRIPT), (0xE0000, NEUTRAL),
+]
+_RANGE_STARTS = np.array([start for start, _ in _SCRIPT_RANGES], dtype=np.uint32)
+_RANGE_SCRIPTS = np.array([script for _, script in _SCRIPT_RANGES], dtype=np.intp)
+
+
+def script_histogram(text):
+    """一次向量化遍历统计各类别的字符数"""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    scripts = _RANGE_SCRIPTS[np.searchsorted(_RANGE_STARTS, codes, side="right") - 1]
+    return np.bincount(scripts, minlength=PERSIAN_MARK + 1)
+
+
+def _keyword_group(words):
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+# 所有关键词编译成一个正则，一次遍历得到各语言的命中数；其他单词归入 word 组，用来计算命中比例。
+# 下划线视为分隔符（文件名中常见 编号_标题）
+_spanish = set(SPANISH_KEYWORDS + SPANISH_WORDS) - ROMANCE_SHARED_WORDS
+_portuguese = set(PORTUGUESE_KEYWORDS + PORTUGUESE_WORDS) - ROMANCE_SHARED_WORDS
+# 西语、葡语都不使用的重音字母（法语、意大利语等），出现时不做西语 / 葡语判定
+_OTHER_ROMANCE_ACCENTS = re.compile(r"[æèëìîïòùûÿœ]", re.IGNORECASE)
+KEYWORD_PATTERN = re.compile(
+    rf"(?<![^\W_])(?:(?P<ar>{_keyword_group(ARABIC_KEYWORDS)})|(?P<es>{_keyword_group(_spanish - _portuguese)})"
+    rf"|(?P<pt>{_keyword_group(_portuguese - _spanish)})|(?P<shared>{_keyword_group(_spanish & _portuguese)})"
+    rf"|(?P<en>{_keyword_group(ENGLISH_WORDS)}))(?![^\W_])|(?P<word>[^\W\d_]+(?:'[^\W\d_]+)?)",
+    re.IGNORECASE,
+)
+
+
+def classify_by_script(text, min_ratio=0.2):
+    """
+    不调用 langdetect 的快速判定：文字系统直方图 + 关键词命中。
+    把握足够时返回语言代码，把握不足时返回 None，交给 langdetect。
+    西语 / 葡语只根据两种语言特有的词判定，法语、意大利语等没有建模的语言不会被误判。
+    """
+    counts = script_histogram(text)
+    latin = counts[LATIN] + counts[LATIN_ACCENTED] + counts[SPANISH_MARK] + counts[PORTUGUESE_MARK]
+    arabic = counts[ARABIC] + counts[PERSIAN_MARK]
+    letters = latin + arabic + counts[OTHER_SCRIPT]
+    if letters == 0:
+        return "en"  # langdetect 对没有字母的文本会失败，原规则同样默认英语
+    if arabic >= letters * 0.5:
+        # 出现波斯语、乌尔都语特有字母时交给 langdetect 区分
+        return None if counts[PERSIAN_MARK] else "ar"
+    if latin < letters * 0.8:
+        return None
+
+    hits = Counter(match.lastgroup for match in KEYWORD_PATTERN.finditer(text))
+    words = sum(hits.values())
+    spanish, portuguese, english = hits["es"], hits["pt"], hits["en"]
+    accented = counts[LATIN_ACCENTED] + counts[SPANISH_MARK] + counts[PORTUGUESE_MARK]
+    if english >= 2 and english >= words * min_ratio and (spanish + portuguese) * 4 <= english and not accented:
+        return "en"
+    if (spanish or portuguese) and _OTHER_ROMANCE_ACCENTS.search(text):
+        return None
+    if (spanish >= 2 and spanish + hits["shared"] >= words * min_ratio and not portuguese
+            and english * 4 <= spanish and not counts[PORTUGUESE_MARK]):
+        return "es"
+    if (portuguese >= 2 and portuguese + hits["shared"] >= words * min_ratio and not spanish
+            and english * 4 <= portuguese and not counts[SPANISH_MARK]):
+        return "pt"
+    return None
+
 def detect_language_from_text(text):
-    """根据关键词和字符集检测文本语言"""
+    """根据字符集、关键词和 langdetect 检测文本语言；快速判定有把握时不调用 langdetect"""
+    fast_language = classify_by_script(text)
+    if fast_language is not None:
+        return fast_language
+    return detect_with_langdetect(text)
+
+def detect_with_langdetect(text):
+    """langdetect 检测，失败时按关键词和字符集规则判定"""
     try:
         # 使用langdetect尝试检测语言
         detected_language = detect(text)
         return detected_language
     except LangDetectException:
         # 如果langdetect检测失败，根据规则默认判定语言
-        arabic_keywords = [
-            "السلام", "مرحبا", "شكرا", "الله", "محمد", "السعودية", 
-            "إسلام", "قرآن", "مسلم", "جميل", "العربية", "اللغة"
-        ]
-        spanish_keywords = [
-            "hola", "gracias", "por", "amigo", "buenos", "dias", 
-            "mañana", "fiesta", "adiós", "familia", "feliz", "navidad"
-        ]
-        portuguese_keywords = [
-            "obrigado", "oi", "de", "amigo", "bom", "dia", 
-            "português", "feliz", "brasil", "carnaval", "gosto", "saúde"
-        ]
-
         # 检测是否包含关键词
-        if any(keyword in text for keyword in arabic_keywords):
+        if any(keyword in text for keyword in ARABIC_KEYWORDS):
             return "ar"
-        elif any(keyword in text for keyword in spanish_keywords):
+        elif any(keyword in text for keyword in SPANISH_KEYWORDS):
             return "es"
-        elif any(keyword in text for keyword in portuguese_keywords):
+        elif any(keyword in text for keyword in PORTUGUESE_KEYWORDS):
             return "pt"
-        
+
         # 检测字符集特征
         if any("\u0600" <= char <= "\u06FF" for char in text):  # 阿拉伯字母范围
             return "ar"
@@ -59,9 +175,28 @@ def detect_language_from_text(text):
         # 默认返回英语
         return "en"
 
-def detect_folder_language(folder_path):
-    """根据文件夹中的文本文档或文件名，检测文件夹的语言"""
-    print(f"正在处理文件夹: {folder_path}")
+# 每个文本文档最多读取的字节数：长文档只取开头、中间、结尾三段，不必整篇读入和检测
+SAMPLE_BYTES = 3000
+
+def read_text_sample(path, size, sample_bytes=SAMPLE_BYTES):
+    """读取文本文档用于检测语言的部分；截断处不完整的 UTF-8 字符直接丢弃"""
+    with open(path, "rb") as f:
+        if size <= sample_bytes:
+            data = f.read()
+        else:
+            part = sample_bytes // 3
+            chunks = []
+            for offset in (0, (size - part) // 2, size - part):
+                f.seek(offset)
+                chunks.append(f.read(part))
+            data = b"\n".join(chunks)
+    return data.decode("utf-8", errors="ignore")
+
+def detect_folder_language(folder_path, cache=None, verbose=True):
+    """根据文件夹中的文本文档或文件名，检测文件夹的语言；传入 cache（LanguageCache）时复用未变化文档的结果"""
+    folder_path = os.path.abspath(folder_path)
+    if verbose:
+        print(f"正在处理文件夹: {folder_path}")
     language_counts = Counter()  # 统计语言分布
     video_files = []
     text_files = []
@@ -70,33 +205,45 @@ def detect_folder_language(folder_path):
     # 支持的语言列表，英语优先级最低
     supported_languages = ["ar", "es", "pt", "en"]
 
-    # 遍历文件夹，分类文件
-    for item in os.listdir(folder_path):
-        item_path = os.path.join(folder_path, item)
-        if os.path.isfile(item_path):  # 只处理文件
-            if item.endswith(".mp4"):
-                video_files.append(item_path)
-            elif item.endswith(".txt"):
-                text_files.append(item_path)
+    # 遍历文件夹，分类文件；文本文档同时记下大小和修改时间，用于判断缓存是否有效
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_file():  # 只处理文件
+                if entry.name.endswith(".mp4"):
+                    video_files.append(entry.path)
+                elif entry.name.endswith(".txt"):
+                    stat = entry.stat()
+                    text_files.append((entry.path, stat.st_size, stat.st_mtime_ns))
 
-    print(f"找到视频文件: {len(video_files)} 个，文本文档: {len(text_files)} 个")
+    if verbose:
+        print(f"找到视频文件: {len(video_files)} 个，文本文档: {len(text_files)} 个")
 
     # 判断使用逻辑
     if len(text_files) > len(video_files) * 0.9:  # 文本文档数量超过视频数量的90%
         logic_used = "文本文档汇总"
-        print(f"使用逻辑: {logic_used}")
-        for text_file in text_files:
-            try:
-                with open(text_file, "r", encoding="utf-8") as f:
-                    content = f.read()
-                    language = detect_language_from_text(content)
-                    if language != "unknown":
-                        language_counts[language] += 1
-            except (PermissionError, FileNotFoundError) as e:
-                print(f"警告: 无法读取文件 {text_file} - {e}")
+        if verbose:
+            print(f"使用逻辑: {logic_used}")
+        cached = cache.folder_entries(folder_path) if cache is not None else {}
+        new_rows = []
+        for text_file, size, mtime_ns in text_files:
+            entry = cached.get(text_file)
+            if entry is not None and entry[:2] == (size, mtime_ns):
+                language = entry[2]
+            else:
+                try:
+                    language = detect_language_from_text(read_text_sample(text_file, size))
+                except (PermissionError, FileNotFoundError) as e:
+                    print(f"警告: 无法读取文件 {text_file} - {e}")
+                    continue
+                new_rows.append((text_file, folder_path, size, mtime_ns, language))
+            if language != "unknown":
+                language_counts[language] += 1
+        if cache is not None:
+            cache.update_folder(folder_path, new_rows, {text_file for text_file, _, _ in text_files})
     else:  # 否则使用视频文件名判断语言
         logic_used = "视频文件名"
-        print(f"使用逻辑: {logic_used}")
+        if verbose:
+            print(f"使用逻辑: {logic_used}")
         for video in video_files:
             video_name = Path(video).stem
             clean_name = clean_filename(video_name)
@@ -117,34 +264,61 @@ def detect_folder_language(folder_path):
         else:
             detected_language = "en"  # 如果没有任何支持语言，默认返回英语
 
-    print(f"检测结果: {detected_language}")
+    if verbose:
+        print(f"检测结果: {detected_language}")
     return logic_used, detected_language
 
-def process_folders(base_folders, excluded_folders):
-    """处理主文件夹中的所有子文件夹，并为每个子文件夹定性语言"""
-    results = []
+# 子进程各自打开的语言缓存，按库路径缓存
+_caches = {}
+
+def _detect_in_worker(folder_path, cache_path):
+    if cache_path not in _caches:
+        _caches[cache_path] = LanguageCache(cache_path, DETECTOR_VERSION)
+    return detect_folder_language(folder_path, _caches[cache_path], verbose=False)
+
+def process_folders(base_folders, excluded_folders, output_file="folder_languages.xlsx",
+                    cache_path="folder_languages.db", workers=None):
+    """
+    处理主文件夹中的所有子文件夹，并为每个子文件夹定性语言。
+    子文件夹分到进程池中并行检测，逐个文档的结果缓存在 cache_path 中，
+    重新运行时只检测新增或修改过的文档；全部完成后一次性写出 Excel。
+    """
+    excluded = {os.path.normpath(folder) for folder in excluded_folders}
+    folders = []
 
     # 遍历主文件夹及其子文件夹
     for base_folder in base_folders:
         print(f"开始处理主文件夹: {base_folder}")
-        for folder_name in os.listdir(base_folder):
+        for folder_name in sorted(os.listdir(base_folder)):
             folder_path = os.path.join(base_folder, folder_name)
 
             # 检查是否是需要排除的文件夹
-            if folder_path in excluded_folders:
+            if os.path.normpath(folder_path) in excluded:
                 print(f"跳过文件夹: {folder_name}")
                 continue
 
             if os.path.isdir(folder_path):  # 只处理子文件夹
-                print(f"开始处理子文件夹: {folder_name}")
-                logic_used, detected_language = detect_folder_language(folder_path)
-                results.append([base_folder, folder_name, logic_used, detected_language])
+                folders.append((base_folder, folder_name, folder_path))
+
+    results = [None] * len(folders)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_detect_in_worker, folder_path, cache_path): index
+                   for index, (_, _, folder_path) in enumerate(folders)}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="检测文件夹语言", unit="folder"):
+            index = futures[future]
+            base_folder, folder_name, folder_path = folders[index]
+            try:
+                logic_used, detected_language = future.result()
+            except Exception as e:
+                print(f"错误: 处理文件夹 {folder_path} 时失败 - {e}")
+                continue
+            results[index] = [base_folder, folder_name, logic_used, detected_language]
 
     # 将结果保存为 Excel
-    output_file = "folder_languages.xlsx"
-    df = pd.DataFrame(results, columns=["主文件夹", "子文件夹", "判断逻辑", "检测语言"])
+    df = pd.DataFrame([row for row in results if row is not None], columns=["主文件夹", "子文件夹", "判断逻辑", "检测语言"])
     df.to_excel(output_file, index=False)  # 删除 encoding 参数
     print(f"所有文件夹语言信息已保存到 {output_file}")
+    print(df["检测语言"].value_counts().to_string())
 
 # 主程序
 if __name__ == "__main__":
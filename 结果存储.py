@@ -0,0 +1,52 @@
+from pathlib import Path
+import pandas as pd
+from 数据库 import SQLiteStore
+
+
+class ResultStore(SQLiteStore):
+    """
+    追加写入的识别结果存储：每个视频一行 INSERT，进程中途退出也不会破坏已写入的结果。
+    同一视频只保留最后一次的结果：写入结果后、标记为已处理前中断时，重新识别会替换之前的行。
+    需要 Excel 时调用 export() 一次性生成 Video / Content 两列的表格。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        video TEXT NOT NULL,
+        content TEXT NOT NULL
+    );
+    -- 旧库没有唯一约束，先去掉重复的视频（保留最后一次的结果）
+    DELETE FROM results WHERE id NOT IN (SELECT MAX(id) FROM results GROUP BY video);
+    CREATE UNIQUE INDEX IF NOT EXISTS results_video ON results (video);
+    """
+
+    def append(self, video_name, content):
+        with self.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO results (video, content) VALUES (?, ?)", (video_name, content))
+
+    def count(self):
+        return self.connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    # 导入旧版直接写入 Excel 的结果，避免导出时覆盖丢失
+    def import_excel(self, excel_file):
+        df = pd.read_excel(excel_file)
+        rows = [(str(video), "" if pd.isna(content) else str(content)) for video, content in zip(df["Video"], df["Content"])]
+        with self.connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO results (video, content) VALUES (?, ?)", rows)
+
+    def export(self, output_file):
+        rows = self.connection().execute("SELECT video, content FROM results ORDER BY id").fetchall()
+        df = pd.DataFrame(rows, columns=["Video", "Content"])
+        df.to_excel(output_file, index=False)
+
+
+# 打开与 Excel 结果文件同名的 .db；首次使用时导入已有的 Excel 内容
+def open_result_store(output_file):
+    output_file = Path(output_file)
+    db_path = output_file.with_suffix(".db")
+    is_new = not db_path.exists()
+    store = ResultStore(db_path)
+    if is_new and output_file.exists():
+        store.import_excel(output_file)
+    return store
@@ -0,0 +1,166 @@
+import json
+import threading
+from pathlib import Path
+import cv2
+from 帧指纹 import dhash, hamming
+from 数据库 import SQLiteStore
+from 文字区域 import find_text_regions
+
+
+# 字幕带：画面中所有文字行所在的整行区域（全宽，不受文字框检测左右误差影响），没有文字时返回 None
+def _text_band(frame):
+    regions = find_text_regions(frame)
+    if not regions:
+        return None
+    top = min(y for _, y, _, _ in regions)
+    bottom = max(y + h for _, y, _, h in regions)
+    return frame[top:bottom]
+
+
+# 视频级指纹：在固定的相对位置（时长的 (i + 0.5) / positions 处）各取一帧，计算整帧的小尺寸 dHash
+# 和字幕带的 dHash，分别拼接成两个整数，与时长一起返回 (duration, signature, captions)。
+# 重新编码、缩放后的同一视频两者都相近；同一模板换了字幕的视频画面指纹相近，但字幕带指纹不同。
+# 没有文字的位置字幕带指纹为 0；无法读取时长或某个位置的帧时返回 None
+def video_fingerprint(video_path, positions=16, hash_size=8, caption_hash_size=16):
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        if fps <= 0 or frame_count <= 0:
+            return None
+        bits = 2 * hash_size * hash_size
+        caption_bits = 2 * caption_hash_size * caption_hash_size
+        signature = captions = 0
+        for i in range(positions):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int((i + 0.5) / positions * frame_count))
+            ret, frame = cap.read()
+            if not ret:
+                return None
+            signature |= dhash(frame, hash_size) << (bits * i)
+            band = _text_band(frame)
+            if band is not None:
+                captions |= dhash(band, caption_hash_size) << (caption_bits * i)
+        return frame_count / fps, signature, captions
+    finally:
+        cap.release()
+
+
+# 把 key 从低位起按 width 位切成 count 段
+def _split(key, width, count):
+    mask = (1 << width) - 1
+    return [(key >> (width * i)) & mask for i in range(count)]
+
+
+class VideoFingerprintIndex(SQLiteStore):
+    """
+    跨视频的近似重复索引：记录每个已识别视频的视频级指纹和识别出的文字。
+    同一视频被重新下载或转码后文件哈希不同，但指纹相近、时长相同，可以直接复用之前的文字。
+    复用前逐个采样位置核对：每个位置的字幕带指纹都要相近（有无文字也要一致），整帧指纹的总距离不超过
+    平均每个位置 max_distance 位，只换了字幕的同模板视频不会被当成重复。
+    候选用多索引哈希查找：画面指纹切成 max_distance * positions + 1 段，距离在范围内的两个指纹
+    至少有一段完全相同，每段按值建哈希表，只核对至少有一段相同的视频。
+    指纹保存在 SQLite 中，查询时增量载入内存，多个进程可以共用同一个库。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS videos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT NOT NULL,
+        duration REAL NOT NULL,
+        signature TEXT NOT NULL,
+        texts TEXT NOT NULL,
+        captions TEXT
+    );
+    """
+
+    def __init__(self, db_path, positions=16, hash_size=8, caption_hash_size=16, max_distance=3,
+                 max_caption_distance=24, min_bits=4, duration_tolerance=0.02):
+        super().__init__(db_path)
+        with self.connection() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(videos)")}
+            # 旧库没有字幕带指纹，已有的记录无法核对字幕，不再参与匹配
+            if "captions" not in columns:
+                conn.execute("ALTER TABLE videos ADD COLUMN captions TEXT")
+        self.positions = positions
+        self.hash_size = hash_size
+        self.caption_hash_size = caption_hash_size
+        # 画面指纹平均每个位置允许 max_distance 位不同；字幕带指纹每个位置都不能超过 max_caption_distance 位；
+        # 置位少于 min_bits 的位置视为纯色画面
+        self.max_distance = max_distance * positions
+        self.max_caption_distance = max_caption_distance
+        self.min_bits = min_bits * positions
+        self.duration_tolerance = duration_tolerance
+        bits = 2 * hash_size * hash_size * positions
+        self.band_count = self.max_distance + 1
+        self.band_width = -(-bits // self.band_count)
+        self.bands = [{} for _ in range(self.band_count)]  # 段的值 -> 记录编号
+        self.entries = {}  # 记录编号 -> (duration, signature, captions)
+        self.loaded_id = 0
+        self.lock = threading.Lock()
+
+    def fingerprint(self, video_path):
+        return video_fingerprint(video_path, self.positions, self.hash_size, self.caption_hash_size)
+
+    # 黑屏、纯色为主的视频指纹几乎全为 0，彼此都会匹配，不参与索引
+    def _usable(self, fingerprint):
+        return fingerprint is not None and bin(fingerprint[1]).count("1") >= self.min_bits
+
+    # 载入其他线程或进程新写入的指纹
+    def _refresh(self):
+        rows = self.connection().execute(
+            "SELECT id, duration, signature, captions FROM videos WHERE id > ? AND captions IS NOT NULL ORDER BY id",
+            (self.loaded_id,),
+        ).fetchall()
+        for row_id, duration, signature, captions in rows:
+            signature = int(signature, 16)
+            self.entries[row_id] = (duration, signature, int(captions, 16))
+            for band, value in zip(self.bands, _split(signature, self.band_width, self.band_count)):
+                # 全 0 的段来自纯色画面，几乎所有视频都有，不建索引
+                if value:
+                    band.setdefault(value, []).append(row_id)
+            self.loaded_id = row_id
+
+    # 每个采样位置的字幕都一致：同有文字且指纹相近，或同样没有文字
+    def _same_captions(self, a, b):
+        caption_bits = 2 * self.caption_hash_size * self.caption_hash_size
+        for x, y in zip(_split(a, caption_bits, self.positions), _split(b, caption_bits, self.positions)):
+            if bool(x) != bool(y) or hamming(x, y) > self.max_caption_distance:
+                return False
+        return True
+
+    # 返回最相近的已识别视频 (路径, 文字列表)，没有时返回 None
+    def find(self, fingerprint):
+        if not self._usable(fingerprint):
+            return None
+        duration, signature, captions = fingerprint
+        tolerance = max(0.5, duration * self.duration_tolerance)
+        with self.lock:
+            self._refresh()
+            candidates = set()
+            for band, value in zip(self.bands, _split(signature, self.band_width, self.band_count)):
+                if value:
+                    candidates.update(band.get(value, ()))
+            matches = []
+            for row_id in candidates:
+                other_duration, other_signature, other_captions = self.entries[row_id]
+                if abs(other_duration - duration) > tolerance:
+                    continue
+                distance = hamming(signature, other_signature)
+                if distance <= self.max_distance and self._same_captions(captions, other_captions):
+                    matches.append((distance, row_id))
+        if not matches:
+            return None
+        _, row_id = min(matches)
+        path, texts = self.connection().execute("SELECT path, texts FROM videos WHERE id = ?", (row_id,)).fetchone()
+        return path, json.loads(texts)
+
+    def add(self, video_path, fingerprint, texts):
+        if not self._usable(fingerprint):
+            return
+        duration, signature, captions = fingerprint
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO videos (path, duration, signature, captions, texts) VALUES (?, ?, ?, ?, ?)",
+                (str(Path(video_path).resolve()), duration, format(signature, "x"), format(captions, "x"),
+                 json.dumps(texts, ensure_ascii=False)),
+            )
@@ -0,0 +1,464 @@
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+import cv2
+import numpy as np
+from 帧指纹 import FrameDeduper
+from 文字区域 import find_text_regions
+from OCR客户端 import HEALTH_CHECK_IMAGE, OCRClient
+from 识别视频内关键帧上文字 import process_video
+from Umi_orc文字识别测试 import extract_text_from_video
+from 调度器 import VideoScheduler
+from 处理清单 import VideoManifest
+from 文字索引 import TextSearchIndex
+
+# 字幕文本；合成视频中字幕框的灰度编码了字幕序号，模拟 OCR 服务据此还原文本
+CAPTIONS = [
+    "she never plays dress up at home",
+    "what did you say to him yesterday",
+    "my horse retired last summer",
+    "we walked along the river until dark",
+    "nobody told me about the party",
+    "bring two apples and a loaf of bread",
+    "the train leaves at seven sharp",
+    "keep your voice down please",
+    "i have been waiting for an hour",
+    "look at the size of that wave",
+    "they moved to a small town up north",
+    "do not forget to feed the cat",
+    "this soup needs a little more salt",
+    "he fixed the old bike by himself",
+    "turn left after the bakery",
+    "we should paint the fence green",
+    "call me when you get there",
+]
+BOX_LEVEL_BASE = 96
+BOX_LEVEL_STEP = 9
+BOX_LEVEL_TOLERANCE = 4
+
+# 可选的流水线配置：(函数, 额外参数)
+PIPELINES = {
+    "ffmpeg": (process_video, {}),
+    "ffmpeg-adaptive": (process_video, {"sampling": "adaptive"}),
+    "ffmpeg-mosaic": (process_video, {"batch_size": 8}),
+    "opencv": (extract_text_from_video, {}),
+    "opencv-adaptive": (extract_text_from_video, {"sampling": "adaptive"}),
+    "opencv-mosaic": (extract_text_from_video, {"batch_size": 8}),
+}
+# main() 实际使用的调度器流水线（解码进程池 + 帧通道 + OCR 线程）：(VideoScheduler 的额外参数)
+SCHEDULER_PIPELINES = {
+    "scheduler": {},
+    "scheduler-mosaic": {"batch_size": 8},
+}
+
+
+def caption_level(caption_id):
+    return BOX_LEVEL_BASE + caption_id * BOX_LEVEL_STEP
+
+
+# 随机生成字幕时间表：大部分字幕持续 1.5~4 秒，少数不到 1 秒，字幕之间偶尔留空
+def caption_schedule(duration, rng):
+    schedule = []
+    t = 0.0
+    previous = None
+    while t < duration:
+        if rng.random() < 0.3:
+            t += rng.uniform(0.5, 1.5)
+            continue
+        length = rng.uniform(0.4, 0.9) if rng.random() < 0.2 else rng.uniform(1.5, 4.0)
+        caption_id = rng.choice([i for i in range(len(CAPTIONS)) if i != previous])
+        schedule.append((t, min(t + length, duration), caption_id))
+        previous = caption_id
+        t += length
+    return schedule
+
+
+def draw_frame(width, height, t, caption_id):
+    # 缓慢平移的低对比度渐变背景，不会被当成文字区域
+    ramp = (np.sin(np.linspace(0, 2 * np.pi, width) + t) + 1) * 12 + 8
+    frame = np.repeat(np.tile(ramp.astype(np.uint8), (height, 1))[:, :, None], 3, axis=2)
+    if caption_id is not None:
+        text = CAPTIONS[caption_id]
+        level = caption_level(caption_id)
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        (text_width, text_height), baseline = cv2.getTextSize(text, font, 0.9, 2)
+        x = (width - text_width) // 2
+        y = height - 40
+        cv2.rectangle(frame, (x - 8, y - text_height - 8), (x + text_width + 8, y + baseline + 8),
+                      (level, level, level), -1)
+        color = (0, 0, 0) if level >= 150 else (255, 255, 255)
+        cv2.putText(frame, text, (x, y), font, 0.9, color, 2, cv2.LINE_AA)
+    return frame
+
+
+def generate_video(video_path, duration, fps, width, height, rng):
+    schedule = caption_schedule(duration, rng)
+    writer = cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for index in range(int(duration * fps)):
+        t = index / fps
+        shown = [caption_id for start, end, caption_id in schedule if start <= t < end]
+        writer.write(draw_frame(width, height, t, shown[0] if shown else None))
+    writer.release()
+    return [CAPTIONS[caption_id] for _, _, caption_id in schedule]
+
+
+# 生成合成视频和字幕真值；配置不变时复用已生成的视频
+def prepare_videos(workdir, count, duration, fps, width, height, seed):
+    workdir.mkdir(parents=True, exist_ok=True)
+    truth_file = workdir / "ground_truth.json"
+    config = {"count": count, "duration": duration, "fps": fps, "width": width, "height": height, "seed": seed}
+    if truth_file.exists():
+        saved = json.loads(truth_file.read_text(encoding="utf-8"))
+        if saved["config"] == config:
+            return saved["videos"]
+
+    videos = {}
+    for index in range(count):
+        video_path = workdir / f"video_{index:03d}.mp4"
+        videos[video_path.name] = generate_video(video_path, duration, fps, width, height, random.Random(seed + index))
+    truth_file.write_text(json.dumps({"config": config, "videos": videos}, ensure_ascii=False, indent=2),
+                          encoding="utf-8")
+    return videos
+
+
+# 按纯色行把图片切成横条（拼图中的各块），每条单独检测文字，和真实 OCR 的局部检测一样
+def text_bands(image, min_std=3):
+    busy = np.concatenate([[False], image.std(axis=1) > min_std, [False]])
+    edges = np.flatnonzero(busy[1:] != busy[:-1])
+    return [(int(top), int(bottom)) for top, bottom in zip(edges[::2], edges[1::2])]
+
+
+# 模拟 OCR：找出文字区域，按区域内除文字笔画外最常见的灰度（字幕框底色）还原字幕序号
+def read_captions(image):
+    regions = []
+    for top, bottom in text_bands(image):
+        band = find_text_regions(image[top:bottom], min_height=4, max_height_ratio=1.0)
+        regions.extend((x, y + top, w, h) for x, y, w, h in band)
+
+    items = []
+    for x, y, w, h in regions:
+        histogram = np.bincount(image[y:y + h, x:x + w].ravel(), minlength=256)
+        histogram[:16] = histogram[244:] = 0  # 忽略黑白文字笔画
+        level = int(histogram.argmax())
+        caption_id = round((level - BOX_LEVEL_BASE) / BOX_LEVEL_STEP)
+        if not 0 <= caption_id < len(CAPTIONS):
+            continue
+        if abs(level - caption_level(caption_id)) > BOX_LEVEL_TOLERANCE:
+            continue
+        items.append({"text": CAPTIONS[caption_id], "box": [[x, y], [x + w, y], [x + w, y + h], [x, y + h]]})
+    return items
+
+
+def serve_mock(port, latency, jitter, failure_rate, seed):
+    """本地模拟 localhost:9999/api/ocr：可配置延迟和失败率，GET /stats 返回请求计数（健康检查单独计数）。"""
+    from aiohttp import web
+
+    rng = random.Random(seed)
+    stats = {"calls": 0, "failures": 0, "health_checks": 0}
+
+    async def ocr(request):
+        body = await request.json()
+        if body["base64"] == HEALTH_CHECK_IMAGE:
+            stats["health_checks"] += 1
+            if failure_rate >= 1:
+                return web.Response(status=503, text="Service Unavailable")
+            return web.json_response({"code": 101, "data": "No text found"})
+        stats["calls"] += 1
+        await asyncio.sleep(max(0.0, rng.gauss(latency, jitter)))
+        if rng.random() < failure_rate:
+            stats["failures"] += 1
+            return web.Response(status=503, text="Service Unavailable")
+        buffer = np.frombuffer(base64.b64decode(body["base64"]), np.uint8)
+        image = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+        items = await asyncio.get_running_loop().run_in_executor(None, read_captions, image)
+        if not items:
+            return web.json_response({"code": 101, "data": "No text found"})
+        return web.json_response({"code": 100, "data": items})
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    async def reset(request):
+        stats.update(calls=0, failures=0, health_checks=0)
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=64 * 1024 ** 2)
+    app.router.add_post("/api/ocr", ocr)
+    app.router.add_get("/stats", get_stats)
+    app.router.add_post("/reset", reset)
+    web.run_app(app, host="127.0.0.1", port=port, print=None)
+
+
+def mock_request(base_url, path, method="GET", timeout=1):
+    request = urllib.request.Request(base_url + path, method=method)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def wait_for_mock(base_url, timeout=15):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return mock_request(base_url, "/stats")
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+# 记录每个请求从提交到完成的耗时（包括排队和重试）
+class TimedOCRClient(OCRClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def _timed(self, future):
+        start = time.perf_counter()
+        future.add_done_callback(lambda _: self.latencies.append(time.perf_counter() - start))
+        return future
+
+    def submit(self, encoded_string, lang="eng", frame_hash=None):
+        return self._timed(super().submit(encoded_string, lang, frame_hash))
+
+    def submit_items(self, encoded_string, lang="eng"):
+        return self._timed(super().submit_items(encoded_string, lang))
+
+
+# 峰值内存（MB）：Linux/macOS 用 resource，Windows 上有 psutil 时用 psutil，否则返回 None；
+# children=True 时返回已结束的子进程中最大的峰值（只支持 resource）
+def peak_rss_mb(children=False):
+    try:
+        import resource
+    except ImportError:
+        if children:
+            return None
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return usage / 1024 ** 2 if os.uname().sysname == "Darwin" else usage / 1024
+
+
+# 调度器使用的 OCR 客户端换成记录请求耗时的版本
+class TimedVideoScheduler(VideoScheduler):
+    def make_client(self):
+        self.client = TimedOCRClient(urls=self.ocr_urls, max_in_flight=self.max_in_flight, cache=self.ocr_cache)
+        return self.client
+
+
+# 把视频放进临时目录的一个子文件夹，按 main() 的方式整体调度；识别出的文字从全文索引读回
+def run_scheduler(name, video_paths, urls, max_in_flight, verbose=False, decode_workers=None):
+    with tempfile.TemporaryDirectory(dir=video_paths[0].parent, ignore_cleanup_errors=True) as temp_dir:
+        folder = Path(temp_dir) / "videos"
+        folder.mkdir()
+        for video_path in video_paths:
+            try:
+                os.link(video_path, folder / video_path.name)
+            except OSError:
+                shutil.copy(video_path, folder / video_path.name)
+        text_index = TextSearchIndex(Path(temp_dir) / "texts.db")
+        scheduler = TimedVideoScheduler(VideoManifest(Path(temp_dir) / "manifest.db"), ocr_urls=urls,
+                                        max_in_flight=max_in_flight, decode_workers=decode_workers,
+                                        text_index=text_index, **SCHEDULER_PIPELINES[name])
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            if not verbose:
+                devnull = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+                stack.enter_context(contextlib.redirect_stderr(devnull))  # 进度条
+            scheduler.run(temp_dir)
+        elapsed = time.perf_counter() - start
+        texts = {video_path.name: [] for video_path in video_paths}
+        rows = text_index.connection().execute(
+            "SELECT videos.video, lines.text FROM lines JOIN videos ON videos.id = lines.video_id ORDER BY lines.id"
+        )
+        for video, text in rows:
+            texts[video].append(text)
+    return {
+        "seconds": elapsed,
+        "frames_decoded": scheduler.frames_total,
+        "frames_skipped": scheduler.frames_skipped,
+        "errors": scheduler.failed,
+        "latencies": scheduler.client.latencies,
+        "endpoints": scheduler.client.endpoint_stats(),
+        "peak_rss_mb": peak_rss_mb(),
+        "children_peak_rss_mb": peak_rss_mb(children=True),
+        "texts": texts,
+    }
+
+
+# 在独立进程中运行一个流水线，峰值内存互不影响
+def run_pipeline(name, video_paths, urls, max_in_flight, verbose=False, decode_workers=None):
+    if name in SCHEDULER_PIPELINES:
+        return run_scheduler(name, video_paths, urls, max_in_flight, verbose, decode_workers)
+    function, options = PIPELINES[name]
+    client = TimedOCRClient(urls=urls, max_in_flight=max_in_flight)
+    texts = {}
+    frames_decoded = 0
+    frames_skipped = 0
+    errors = 0
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        for video_path in video_paths:
+            deduper = FrameDeduper()
+            try:
+                texts[video_path.name] = function(video_path, client=client, deduper=deduper, **options)
+            except Exception as e:
+                errors += 1
+                texts[video_path.name] = []
+                print(f"Error processing {video_path.name}: {e!r}", file=sys.stderr)
+            frames_decoded += deduper.total
+            frames_skipped += deduper.skipped
+    elapsed = time.perf_counter() - start
+    client.close()
+    return {
+        "seconds": elapsed,
+        "frames_decoded": frames_decoded,
+        "frames_skipped": frames_skipped,
+        "errors": errors,
+        "latencies": client.latencies,
+        "endpoints": client.endpoint_stats(),
+        "peak_rss_mb": peak_rss_mb(),
+        "texts": texts,
+    }
+
+
+# 字幕召回率：真值中每条字幕（按视频）是否出现在识别结果里
+def recall(ground_truth, texts):
+    expected = found = 0
+    for video_name, captions in ground_truth.items():
+        extracted = set(texts.get(video_name, []))
+        unique = set(captions)
+        expected += len(unique)
+        found += len(unique & extracted)
+    return found / expected if expected else 1.0
+
+
+def summarize(name, ground_truth, run, mock_stats):
+    latencies = np.array(run["latencies"]) * 1000
+    videos = len(ground_truth)
+    return {
+        "pipeline": name,
+        "videos": videos,
+        "seconds": round(run["seconds"], 3),
+        "videos_per_s": round(videos / run["seconds"], 3) if run["seconds"] else None,
+        "frames_decoded": run["frames_decoded"],
+        "frames_skipped": run["frames_skipped"],
+        "ocr_requests": len(run["latencies"]),
+        "ocr_calls": mock_stats["calls"],
+        "ocr_failures": mock_stats["failures"],
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 1) if latencies.size else None,
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)), 1) if latencies.size else None,
+        "peak_rss_mb": round(run["peak_rss_mb"], 1) if run["peak_rss_mb"] is not None else None,
+        # 调度器的解码在子进程中进行，单独给出子进程中最大的峰值内存
+        "children_peak_rss_mb": (round(run["children_peak_rss_mb"], 1)
+                                 if run.get("children_peak_rss_mb") is not None else None),
+        "recall": round(recall(ground_truth, run["texts"]), 4),
+        "errors": run["errors"],
+        "endpoints": run["endpoints"],
+    }
+
+
+def print_table(results):
+    columns = ["pipeline", "videos_per_s", "frames_decoded", "ocr_calls", "latency_p50_ms", "latency_p99_ms",
+               "peak_rss_mb", "children_peak_rss_mb", "recall", "errors"]
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def run(args):
+    workdir = Path(args.workdir)
+    print(f"生成 {args.videos} 个合成视频（每个 {args.duration}s）到 {workdir} ...")
+    ground_truth = prepare_videos(workdir, args.videos, args.duration, args.fps, args.width, args.height, args.seed)
+    video_paths = [workdir / name for name in ground_truth]
+
+    # 多个模拟服务使用连续端口；最后 unhealthy_endpoints 个始终返回 503，用来观察熔断
+    context = get_context("spawn")
+    base_urls = [f"http://127.0.0.1:{args.port + index}" for index in range(args.endpoints)]
+    servers = []
+    for index in range(args.endpoints):
+        failure_rate = 1.0 if index >= args.endpoints - args.unhealthy_endpoints else args.failure_rate
+        servers.append(context.Process(target=serve_mock, daemon=True,
+                                       args=(args.port + index, args.latency, args.jitter, failure_rate,
+                                             args.seed + index)))
+    for server in servers:
+        server.start()
+    results = []
+    try:
+        for base_url in base_urls:
+            wait_for_mock(base_url)
+        for name in args.pipelines:
+            for base_url in base_urls:
+                mock_request(base_url, "/reset", method="POST")
+            print(f"运行 {name} ...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                pipeline_run = pool.submit(run_pipeline, name, video_paths,
+                                           [base_url + "/api/ocr" for base_url in base_urls],
+                                           args.max_in_flight, args.verbose, args.decode_workers).result()
+            all_stats = [mock_request(base_url, "/stats") for base_url in base_urls]
+            mock_stats = {key: sum(stats[key] for stats in all_stats) for key in ("calls", "failures")}
+            results.append(summarize(name, ground_truth, pipeline_run, mock_stats))
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.join()
+
+    print_table(results)
+    if args.endpoints > 1:
+        for result in results:
+            print(f"{result['pipeline']}:")
+            for endpoint in result["endpoints"]:
+                print(f"  {endpoint['url']}: {endpoint['requests']} requests, {endpoint['failures']} failures, "
+                      f"{endpoint['trips']} trips, p50 {endpoint['p50_ms']} ms, p99 {endpoint['p99_ms']} ms")
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    output = Path(args.output or f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已保存到 {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用带字幕的合成视频和本地模拟 OCR 服务测量两条识别流水线的吞吐量和召回率")
+    parser.add_argument("--pipelines", nargs="+", choices=list(PIPELINES) + list(SCHEDULER_PIPELINES),
+                        default=["ffmpeg", "opencv", "scheduler"])
+    parser.add_argument("--videos", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20.0, help="每个视频的时长（秒）")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default="benchmark_videos")
+    parser.add_argument("--port", type=int, default=9998, help="第一个模拟服务的端口，其余依次加 1")
+    parser.add_argument("--endpoints", type=int, default=1, help="模拟 OCR 服务实例的数量")
+    parser.add_argument("--unhealthy-endpoints", type=int, default=0, help="其中始终返回 503 的实例数量")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟 OCR 的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.01, help="模拟 OCR 延迟的标准差（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="模拟 OCR 返回 503 的概率")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="每个 OCR 服务实例的并发上限")
+    parser.add_argument("--decode-workers", type=int, help="调度器流水线的解码进程数，默认为 CPU 核数")
+    parser.add_argument("--output", help="JSON 结果文件，默认 benchmark_<时间>.json")
+    parser.add_argument("--verbose", action="store_true", help="显示流水线的逐视频输出")
+    run(parser.parse_args())
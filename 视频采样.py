@@ -0,0 +1,165 @@
+import math
+import subprocess
+import cv2
+from 帧指纹 import dhash, hamming
+
+
+# 读取真实帧率（不取整）和时长；帧率元数据缺失时返回 0
+def video_info(cap):
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or math.isnan(fps) or fps <= 0:
+        return 0.0, 0.0
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    duration = frame_count / fps if frame_count > 0 else 0.0
+    return fps, duration
+
+
+# 用 ffprobe 列出关键帧（I 帧）的时间戳
+def keyframe_times(video_path):
+    ffprobe_command = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-skip_frame", "nokey",
+        "-show_entries", "frame=pts_time,best_effort_timestamp_time",
+        "-of", "csv=p=0",
+        str(video_path)
+    ]
+    output = subprocess.run(ffprobe_command, check=True, capture_output=True, text=True).stdout
+    times = []
+    for line in output.splitlines():
+        for value in line.split(","):
+            if value and value != "N/A":
+                times.append(float(value))
+                break
+    return sorted(set(times))
+
+
+# 顺序 grab() 所有帧，只对需要的帧 retrieve()，省去其余帧的颜色转换和拷贝；
+# start 大于 0 时先跳到对应的帧，跳转失败时从头 grab 但不取 start 之前的帧
+def _sample_by_grab(cap, interval, fps, start=0.0):
+    frame_number = 0
+    sample_index = math.ceil(start / interval - 1e-9) if start > 0 else 0
+    # 半帧容差：采样时间落在当前帧的显示区间内就取这一帧；采样时间按序号计算，29.97fps 等帧率不会累积漂移
+    tolerance = 0.5 / fps if fps > 0 else 0.0
+    if sample_index and fps > 0:
+        target = int(sample_index * interval * fps)
+        if cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+            frame_number = target
+    while cap.grab():
+        if fps > 0:
+            timestamp = frame_number / fps
+        else:
+            # 没有可用的帧率时使用解码器给出的时间戳
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if timestamp + tolerance >= sample_index * interval:
+            ret, frame = cap.retrieve()
+            if ret:
+                yield timestamp, frame
+            while sample_index * interval <= timestamp + tolerance:
+                sample_index += 1
+        frame_number += 1
+
+
+# 按时间戳跳转，只解码从最近关键帧到目标帧之间的帧；适合采样间隔远大于关键帧间隔的视频
+def _sample_by_seek(cap, times):
+    for timestamp in times:
+        cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield timestamp, frame
+
+
+def sample_frames_opencv(cap, interval=1.0, mode="grab", video_path=None, start=0.0):
+    """
+    从已打开的 VideoCapture 中按 interval 秒采样，生成 (时间戳秒, 帧)。
+    mode:
+    - "grab"：顺序读取，只对采样帧做 retrieve()；
+    - "seek"：按采样时间点跳转读取；
+    - "iframe"：只取关键帧，每个采样间隔内取第一个关键帧（需要 video_path 调用 ffprobe）。
+    帧率或时长元数据不可用时，seek / iframe 模式回退到 grab 模式。
+    start 大于 0 时只生成不早于 start 的采样点（用于断点续传），时间戳仍从视频开头算起。
+    """
+    fps, duration = video_info(cap)
+    if mode == "grab" or duration <= 0:
+        yield from _sample_by_grab(cap, interval, fps, start)
+    elif mode == "seek":
+        count = int(duration / interval) + 1
+        times = [i * interval for i in range(count) if i * interval < duration]
+        yield from _sample_by_seek(cap, [t for t in times if t >= start - 1e-9])
+    elif mode == "iframe":
+        if video_path is None:
+            raise ValueError("iframe mode requires video_path")
+        times = []
+        for timestamp in keyframe_times(video_path):
+            if not times or timestamp >= times[-1] + interval:
+                times.append(timestamp)
+        yield from _sample_by_seek(cap, [t for t in times if t >= start - 1e-9])
+    else:
+        raise ValueError(f"Unknown sampling mode: {mode}")
+
+
+# 随机读取指定时间点的帧（独立的 VideoCapture，不影响顺序读取的位置）
+class FrameSeeker:
+    def __init__(self, video_path):
+        self.cap = cv2.VideoCapture(str(video_path))
+
+    def read_at(self, timestamp):
+        self.cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def release(self):
+        self.cap.release()
+
+
+class SamplingReport:
+    """记录一个视频实际采样的时间点：粗采样和二分加密各取了哪些帧。"""
+
+    def __init__(self):
+        self.coarse = []
+        self.refined = []
+
+    def summary(self, video_name):
+        refined = ", ".join(f"{t:.2f}s" for t in self.refined)
+        return (f"{video_name}: sampled {len(self.coarse)} coarse + {len(self.refined)} refined frames"
+                + (f" (refined at {refined})" if refined else ""))
+
+
+def adaptive_sample(coarse_frames, seeker, min_gap=0.25, max_distance=4, report=None):
+    """
+    自适应采样：先按粗间隔取帧，相邻两帧指纹差异超过 max_distance 时，
+    在两者之间递归二分取帧，直到间隔小于 min_gap；画面不变的区间不再加密。
+    coarse_frames 生成 (时间戳, 帧)，seeker.read_at(t) 读取任意时间点的帧。
+    按时间顺序生成 (时间戳, 帧)。
+    """
+    report = report if report is not None else SamplingReport()
+
+    def refine(t0, h0, t1, h1):
+        if t1 - t0 <= min_gap:
+            return
+        middle = (t0 + t1) / 2
+        frame = seeker.read_at(middle)
+        if frame is None:
+            return
+        hm = dhash(frame)
+        left_changed = hamming(h0, hm) > max_distance
+        right_changed = hamming(hm, h1) > max_distance
+        if left_changed:
+            yield from refine(t0, h0, middle, hm)
+        # 与两端都不同，说明中间出现了粗采样漏掉的内容（例如不到一秒的字幕）
+        if left_changed and right_changed:
+            report.refined.append(middle)
+            yield middle, frame
+        if right_changed:
+            yield from refine(middle, hm, t1, h1)
+
+    previous = None
+    for timestamp, frame in coarse_frames:
+        frame_hash = dhash(frame)
+        if previous is not None and hamming(previous[1], frame_hash) > max_distance:
+            yield from refine(previous[0], previous[1], timestamp, frame_hash)
+        report.coarse.append(timestamp)
+        yield timestamp, frame
+        previous = (timestamp, frame_hash)
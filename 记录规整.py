@@ -0,0 +1,148 @@
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# 合并时每次读写的字节数
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
+# 规整规则：(标题行结尾, 去掉标题行紧挨着的上一个空行, 跳过标题行下方的空行)
+# - merge（汇总文档）：标题行以 ".mp4:" 结尾，上方只保留一个空行，下方不变
+# - normalize（规整文档）：标题行以 ".mp4" 结尾，上方至少一个空行，跳过下方所有空行
+RULES = {
+    "merge": (".mp4:", True, False),
+    "normalize": (".mp4", False, True),
+}
+# 模式：依次套用的规则。normalize_merge 与原来先用规整文档改写、再用汇总文档合并的结果相同
+MODES = {
+    "merge": ("merge",),
+    "normalize": ("normalize",),
+    "normalize_merge": ("normalize", "merge"),
+}
+
+
+def normalize_lines(lines, mode="merge"):
+    """
+    逐行规整视频标题行前后的空行，生成输出行。每条规则只暂存一个待定的空行（看到下一行是否为标题行再决定去留），
+    多条规则串联成生成器链，仍然只读一遍，内存占用与文件大小无关；结果与原来先 readlines() 再处理完全一致。
+    """
+    for rule in MODES[mode]:
+        lines = _apply_rule(lines, *RULES[rule])
+    return lines
+
+
+def _apply_rule(lines, suffix, drop_before, skip_after):
+    pending = None      # 暂存的空行
+    after_text = False  # 最近输出的一行是否为非空行
+    skipping = False    # 正在跳过标题行下方的空行
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            if skipping:
+                continue
+            if pending is not None:
+                yield pending
+                after_text = False
+            if drop_before:
+                pending = line
+            else:
+                yield line
+                after_text = False
+            continue
+
+        header = stripped.endswith(suffix)
+        if pending is not None:
+            if not header:
+                yield pending
+                after_text = False
+            pending = None
+        if header:
+            # 确保标题行上方有空行
+            if after_text:
+                yield '\n'
+            skipping = skip_after
+        else:
+            skipping = False
+        yield line
+        after_text = True
+    if pending is not None:
+        yield pending
+
+
+def normalize_file(input_path, output_path, mode="merge", separator=""):
+    """流式规整单个文件写到 output_path，末尾附加 separator"""
+    with open(input_path, 'r', encoding='utf-8') as infile, open(output_path, 'w', encoding='utf-8') as outfile:
+        outfile.writelines(normalize_lines(infile, mode))
+        outfile.write(separator)
+
+
+# batch_2.txt 排在 batch_10.txt 之前
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def list_text_files(directory, exclude=None):
+    """目录中的 .txt 文件，按文件名中的编号排序，顺序固定"""
+    exclude = os.path.abspath(exclude) if exclude else None
+    names = sorted((name for name in os.listdir(directory) if name.endswith('.txt')), key=_natural_key)
+    paths = [os.path.join(directory, name) for name in names]
+    return [path for path in paths if os.path.abspath(path) != exclude]
+
+
+# 与 target 同一目录下的临时文件，写完后用 os.replace 原子替换
+def _temp_path(target):
+    target = os.path.abspath(target)
+    fd, path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=f".{os.path.basename(target)}.", suffix=".tmp")
+    os.close(fd)
+    return path
+
+
+def normalize_file_in_place(file_path, mode="normalize"):
+    """规整单个文件：先写同目录的临时文件，再原子替换原文件"""
+    temp_path = _temp_path(file_path)
+    try:
+        normalize_file(file_path, temp_path, mode)
+        shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def merge_text_files(directory, output_file, mode="normalize_merge", workers=None):
+    """
+    规整目录中的所有 .txt 并合并成 output_file，只读一遍源文件，不改写源文件。
+    默认两条规则一起套用，源文件不需要先改写；mode="merge" 时与原来单独运行汇总文档的结果相同。
+    各文件在进程池中并行规整到临时分片，按文件名顺序依次拼接（每个文件之后加一个空行），
+    全部成功后才原子替换 output_file；任一文件失败时保留原来的 output_file。
+    """
+    files = list_text_files(directory, exclude=output_file)
+    temp_output = _temp_path(output_file)
+    parts = [f"{temp_output}.{index}" for index in range(len(files))]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool, open(temp_output, 'wb') as outfile:
+            futures = [pool.submit(normalize_file, file_path, part, mode, '\n') for file_path, part in zip(files, parts)]
+            for future, part in zip(futures, parts):
+                future.result()
+                with open(part, 'rb') as part_file:
+                    shutil.copyfileobj(part_file, outfile, COPY_BUFFER_SIZE)
+                os.remove(part)
+        os.replace(temp_output, output_file)
+        print(f"已合并 {len(files)} 个文件到 {output_file}")
+    finally:
+        for path in parts + [temp_output]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def normalize_files_in_place(directory, mode="normalize", workers=None):
+    """并行规整目录中的所有 .txt，每个文件先写临时文件再原子替换"""
+    files = list_text_files(directory)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(normalize_file_in_place, file_path, mode) for file_path in files]
+        for file_path, future in zip(files, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"错误: 规整文件 {file_path} 时失败 - {e}")
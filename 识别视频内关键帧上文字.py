@@ -1,131 +1,198 @@
-import os
 import subprocess
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
-import pandas as pd
-import requests
-import base64
-import hashlib
-import time
 from tqdm import tqdm
-from difflib import SequenceMatcher
-
-# 用于计算字符串相似性
-def similar(a, b):
-    return SequenceMatcher(None, a, b).ratio()
-
-# 提取视频关键帧到临时文件夹
-def extract_keyframes_with_ffmpeg(video_path, output_dir, fps=1):
-    output_dir.mkdir(parents=True, exist_ok=True)
-    ffmpeg_command = [
-        "ffmpeg",
-        "-i", str(video_path),
-        "-vf", f"fps={fps}",
-        str(output_dir / "frame_%03d.jpg"),
-        "-hide_banner",
-        "-loglevel", "error"
-    ]
-    subprocess.run(ffmpeg_command, check=True)
+from 帧流 import stream_frames_with_ffmpeg
+from 帧指纹 import FrameDeduper
+from 文字区域 import encode_for_ocr, shrink_for_ocr
+from 拼图批处理 import MosaicBatcher
+from 视频采样 import FrameSeeker, SamplingReport, adaptive_sample
+from OCR客户端 import OCR_URLS, get_default_client, ocr_in_order
+from 文本去重 import NearDuplicateIndex
+from 结果存储 import open_result_store
+from 运行统计 import metrics
+
+# 将帧编码为 JPEG 并转成 base64；crop_text=True 时只保留文字区域（灰度、缩小），没有文字区域返回 None
+def encode_frame(frame, crop_text=True):
+    return encode_for_ocr(frame, crop_text)
 
 # 对单张图片进行OCR识别
-def ocr_image(image_path, max_retries=3):
-    with open(image_path, "rb") as img_file:
-        encoded_string = base64.b64encode(img_file.read()).decode("utf-8")
-        data = {"base64": encoded_string, "lang": "eng"}
-    for attempt in range(max_retries):
-        try:
-            response = requests.post("http://localhost:9999/api/ocr", json=data, timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            return [
-                item["text"].strip()
-                for item in result.get("data", [])
-                if isinstance(item, dict) and "text" in item
-            ]
-        except requests.RequestException as e:
-            print(f"Request failed: {e}, retrying {attempt + 1}/{max_retries}")
-            time.sleep(1)
-    return []
-
-# 对视频进行OCR识别
-def process_video(video_path, temp_dir, similarity_threshold=0.8):
-    video_temp_dir = temp_dir / video_path.stem
+def ocr_image(frame, client=None, crop_text=True):
+    with metrics.timer("encode"):
+        encoded_string = encode_frame(frame, crop_text)
+    if encoded_string is None:
+        return []
+    metrics.add_bytes("encode", len(encoded_string))
+    return (client or get_default_client()).ocr(encoded_string)
+
+# 采样视频帧：默认按固定间隔从 ffmpeg 管道读取，不写临时图片；
+# sampling="adaptive" 时在画面变化的区间内二分加密采样，直到间隔小于 min_gap；
+# start 大于 0 时从不早于 start 的采样点开始
+def sample_video_frames(video_path, interval=1.0, sampling="fixed", min_gap=0.25, report=None, start=0.0):
+    frames = stream_frames_with_ffmpeg(video_path, interval, start=start)
+    if sampling == "fixed":
+        yield from frames
+        return
+    if sampling != "adaptive":
+        raise ValueError(f"Unknown sampling mode: {sampling}")
+    seeker = FrameSeeker(video_path)
+    try:
+        yield from adaptive_sample(frames, seeker, min_gap=min_gap, report=report)
+    finally:
+        seeker.release()
+        frames.close()
+
+# 画面与上一次识别的帧几乎相同（字幕未变）时跳过 OCR；帧指纹同时作为 OCR 缓存的键。
+# frames 为 (时间戳, 帧) 序列；encode=False 时生成未编码的图片，交给 MosaicBatcher 拼图
+def select_frames_for_ocr(frames, deduper, crop_text=True, encode=True):
+    for timestamp, frame in metrics.timed_iter("decode", frames):
+        with metrics.timer("fingerprint"):
+            changed = deduper.should_ocr(frame)
+        if changed:
+            with metrics.timer("encode"):
+                if encode:
+                    payload = encode_frame(frame, crop_text)
+                else:
+                    # 解码器会复用帧缓冲，拼图批次等待发送期间缓冲可能已被下一帧覆盖，原始帧需要复制
+                    payload = shrink_for_ocr(frame) if crop_text else frame.copy()
+            if payload is not None:
+                metrics.add_bytes("encode", len(payload) if encode else payload.nbytes)
+                yield timestamp, payload, deduper.last_hash
+
+# 从 ffmpeg 管道采样，挑出需要 OCR 的帧
+def frames_to_ocr(video_path, deduper, crop_text=True, encode=True, **sampling_options):
+    return select_frames_for_ocr(sample_video_frames(video_path, **sampling_options), deduper, crop_text, encode)
+
+# 按帧顺序合并 OCR 结果，去掉相似的重复文本；传入 timestamps 列表时同时记下每条文本首次出现的时间
+def collect_texts(ocr_results, similarity_threshold=0.8, timestamps=None):
     extracted_texts = []
+    text_index = NearDuplicateIndex(similarity_threshold)
+    for timestamp, frame_texts in ocr_results:
+        with metrics.timer("dedup"):
+            for text in frame_texts:
+                if text_index.add_if_new(text):
+                    extracted_texts.append(text)
+                    if timestamps is not None:
+                        timestamps.append(timestamp)
+    return extracted_texts
 
-    # 提取关键帧
-    extract_keyframes_with_ffmpeg(video_path, video_temp_dir)
-
-    # 对提取的关键帧逐一识别
-    for frame_path in video_temp_dir.glob("*.jpg"):
-        frame_texts = ocr_image(frame_path)
-        for text in frame_texts:
-            if not any(similar(text, recorded_text) > similarity_threshold for recorded_text in extracted_texts):
-                extracted_texts.append(text)
-
+# 对视频进行OCR识别。
+# 传入 checkpoint（FrameCheckpoint）时逐帧保存结果，并从上次中断的位置继续；
+# 有帧识别失败时抛出 IncompleteVideo，已完成的部分留在检查点中
+def process_video(video_path, similarity_threshold=0.8, max_hash_distance=4, client=None, sampling="fixed",
+                  crop_text=True, batch_size=None, deduper=None, checkpoint=None, interval=1.0, timestamps=None):
+    client = client or get_default_client()
+    # 可以传入 deduper 以便调用方读取帧数统计
+    deduper = deduper or FrameDeduper(max_distance=max_hash_distance)
+    sampling_report = SamplingReport()
+    progress = checkpoint.open(video_path) if checkpoint is not None else None
+    start = 0.0
+    if progress is not None and progress.done:
+        deduper.last_hash = progress.last_hash
+        start = progress.start_time(interval)
+
+    # 多帧并发识别，结果仍按帧顺序合并；batch_size 大于 1 时把多帧拼成一张图识别
+    batcher = MosaicBatcher(client, batch_size) if batch_size and batch_size > 1 else None
+    frames = frames_to_ocr(video_path, deduper, crop_text, encode=batcher is None, interval=interval,
+                           sampling=sampling, report=sampling_report, start=start)
+    try:
+        with metrics.scope(video=video_path.name), metrics.timer("video"):
+            if progress is None:
+                ocr_results = ocr_in_order(batcher or client, frames)
+            else:
+                ocr_results = progress.results(ocr_in_order(batcher or client, progress.watch(frames)))
+            extracted_texts = collect_texts(ocr_results, similarity_threshold, timestamps)
+    finally:
+        if batcher is not None:
+            batcher.close()
+
+    if sampling == "adaptive":
+        print(sampling_report.summary(video_path.name))
+    print(deduper.report(video_path.name))
     return extracted_texts
 
-# 对单个视频的结果写入文件
-def save_video_result(video_name, extracted_texts, output_file):
+# 查找已识别过的近似重复视频（重新下载、转码后的转发）；返回 (视频指纹, 可复用的文字或 None)
+def find_duplicate_texts(video_file, video_index):
+    with metrics.timer("dup_check"):
+        fingerprint = video_index.fingerprint(video_file)
+        match = video_index.find(fingerprint)
+    if match is None:
+        return fingerprint, None
+    print(f"{video_file.name}: reusing texts of near-duplicate {Path(match[0]).name}")
+    metrics.count("videos_reused")
+    return fingerprint, match[1]
+
+# 对单个视频的结果追加写入结果库，Excel 在文件夹处理完后统一导出；
+# 传入 text_index（TextSearchIndex）时同时把每条文本和时间戳写入全文索引
+def save_video_result(video_name, extracted_texts, result_store, text_index=None, folder=None, timestamps=None):
     if not extracted_texts:
         return
-    if not output_file.exists():
-        df = pd.DataFrame(columns=["Video", "Content"])
-    else:
-        df = pd.read_excel(output_file)
-    new_data = pd.DataFrame([{"Video": video_name, "Content": " ".join(extracted_texts)}])
-    df = pd.concat([df, new_data], ignore_index=True)
-    df.to_excel(output_file, index=False)
-
-# 计算文件哈希值
-def file_hash(filepath):
-    with open(filepath, "rb") as f:
-        file_hash = hashlib.md5()
-        while chunk := f.read(4096):
-            file_hash.update(chunk)
-    return file_hash.hexdigest()
+    with metrics.timer("save"):
+        result_store.append(video_name, " ".join(extracted_texts))
+    if text_index is not None:
+        with metrics.timer("index"):
+            text_index.add_video(folder, video_name, extracted_texts, timestamps)
 
 # 修改 process_folder 函数以支持记录处理进度
-def process_folder(folder_path, output_file, temp_dir, record_file_path):
+# 传入 video_index（VideoFingerprintIndex）时，与已识别视频近似重复的视频直接复用之前的文字
+# 传入 text_index（TextSearchIndex）时，识别结果同时写入全文索引
+def process_folder(folder_path, output_file, manifest, checkpoint=None, video_index=None, text_index=None):
     video_files = list(Path(folder_path).glob("*.mp4"))
-    temp_dir.mkdir(parents=True, exist_ok=True)
-
-    # 读取已处理文件的哈希值
-    processed_videos = set()
-    if Path(record_file_path).exists():
-        with open(record_file_path, "r") as rf:
-            processed_videos = set(rf.read().splitlines())
+    result_store = open_result_store(output_file)
 
     for video_file in tqdm(video_files, desc=f"Processing folder: {folder_path.name}"):
-        try:
-            video_hash = file_hash(video_file)
-            if video_hash in processed_videos:
-                # print(f"Skipping already processed video: {video_file.name}")
-                continue
-
-            # 提取文字并保存
-            extracted_texts = process_video(video_file, temp_dir)
-            # print(f"Extracted {len(extracted_texts)} texts from {video_file.name}")
-            save_video_result(video_file.name, extracted_texts, output_file)
-
-            # 更新记录文件
-            with open(record_file_path, "a") as rf:
-                rf.write(video_hash + "\n")
-        except subprocess.CalledProcessError as e:
-            print(f"FFmpeg failed for {video_file.name}: {e}")
-        except Exception as e:
-            print(f"Error processing {video_file.name}: {e}")
-
-# 主函数
-def main(base_folder):
-    base_path = Path(base_folder)
-    temp_dir = base_path / "temp"
-    record_file_path = "processed_videos.txt"  # 定义记录文件路径
-    subfolders = [subfolder for subfolder in base_path.iterdir() if subfolder.is_dir()]
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        for subfolder in subfolders:
-            output_file = subfolder / f"{subfolder.name}_识别结果.xlsx"
-            executor.submit(process_folder, subfolder, output_file, temp_dir / subfolder.name, record_file_path)
+        with metrics.scope(folder=folder_path.name, video=video_file.name):
+            try:
+                with metrics.timer("manifest"):
+                    processed = manifest.is_processed(video_file)
+                if processed:
+                    # print(f"Skipping already processed video: {video_file.name}")
+                    metrics.count("videos_skipped")
+                    continue
+
+                # 提取文字并保存
+                fingerprint, extracted_texts = None, None
+                timestamps = []
+                if video_index is not None:
+                    fingerprint, extracted_texts = find_duplicate_texts(video_file, video_index)
+                if extracted_texts is None:
+                    extracted_texts = process_video(video_file, checkpoint=checkpoint, timestamps=timestamps)
+                    if video_index is not None:
+                        video_index.add(video_file, fingerprint, extracted_texts)
+                # print(f"Extracted {len(extracted_texts)} texts from {video_file.name}")
+                save_video_result(video_file.name, extracted_texts, result_store, text_index, folder_path.name,
+                                  timestamps)
+
+                # 更新已处理清单；结果已保存，不再需要逐帧检查点
+                with metrics.timer("manifest"):
+                    manifest.mark_processed(video_file)
+                    if checkpoint is not None:
+                        checkpoint.clear(video_file)
+                metrics.count("videos_processed")
+            except subprocess.CalledProcessError as e:
+                metrics.count("videos_failed")
+                print(f"FFmpeg failed for {video_file.name}: {e}")
+            except Exception as e:
+                metrics.count("videos_failed")
+                print(f"Error processing {video_file.name}: {e}")
+
+    # 一次性导出 Excel（Video, Content）
+    if result_store.count():
+        with metrics.scope(folder=folder_path.name), metrics.timer("export"):
+            result_store.export(output_file)
+
+# 主函数：所有子文件夹的视频进入同一个全局队列，解码与 OCR 分别用独立的进程池 / 线程
+# metrics_file / metrics_port 任一指定时开启分阶段统计，结束时打印汇总表并写出指标文件
+# ocr_urls 可以列出多个 OCR 服务实例，默认使用 OCR_URLS
+def main(base_folder, decode_workers=None, ocr_workers=4, max_in_flight=8, sampling="fixed", batch_size=None,
+         metrics_file=None, metrics_port=None, ocr_urls=None):
+    from 调度器 import run_all
+    if metrics_file or metrics_port:
+        metrics.start(metrics_port)
+    try:
+        run_all(base_folder, decode_workers=decode_workers, ocr_workers=ocr_workers, max_in_flight=max_in_flight,
+                sampling=sampling, batch_size=batch_size, ocr_urls=ocr_urls or OCR_URLS)
+    finally:
+        metrics.finish(metrics_file)
 
 if __name__ == "__main__":
     base_folder = r"D:\software\工作文件夹\代码\instagram_crawl\下载视频2\en"
@@ -0,0 +1,138 @@
+import argparse
+import random
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from 测试识别语言 import classify_by_script, clean_filename, detect_language_from_text, detect_with_langdetect
+
+# 合成样本用的句子；文件名和 OCR 字幕都由这些句子加噪音生成
+SENTENCES = {
+    "en": [
+        "you have never been with a retired horse girl before",
+        "when he likes animals with more than four legs",
+        "I want a girl who stays at home and plays dress up all day",
+        "she said she loves me but which one",
+        "this is what happens when you clean your room",
+        "my mom when I come home late",
+    ],
+    "es": [
+        "hola amigo gracias por venir a la fiesta",
+        "cuando mi mamá me ve llegar tarde a casa",
+        "la familia es lo más importante del mundo",
+        "qué haces con el perro de tu vecino",
+        "feliz navidad a todos los que están aquí",
+        "yo no sé por qué pero me gusta mucho",
+    ],
+    "pt": [
+        "obrigado pela ajuda você é muito bom",
+        "quando eu chego em casa e minha mãe está esperando",
+        "isso não é o que eu queria dizer",
+        "bom dia para todos os meus amigos do brasil",
+        "eu gosto muito de carnaval com a família",
+        "você não vai acreditar no que aconteceu",
+    ],
+    # 快速判定没有建模的语言，用来检查不会被误判为西语或葡语
+    "fr": [
+        "je suis là et tu es où",
+        "quand ma mère me voit rentrer tard à la maison",
+        "la famille est ce qui compte le plus au monde",
+        "merci beaucoup de regarder cette vidéo",
+    ],
+    "it": [
+        "ciao amico grazie per essere venuto alla festa",
+        "quando mia mamma mi vede tornare tardi a casa",
+        "la famiglia è la cosa più importante del mondo",
+        "io non so perché ma mi piace molto",
+    ],
+    "ar": [
+        "السلام عليكم ورحمة الله",
+        "مرحبا بكم في قناتي الجديدة",
+        "شكرا جزيلا على المشاهدة",
+        "اللغة العربية جميلة جدا",
+        "هذا الفيديو مضحك للغاية",
+    ],
+}
+NOISE = ["TikTok video", "#fyp", "#viral", "😂", "🔥", "clip", "#foryou", "part 2", "mp4"]
+
+
+# 模拟下载的视频文件名：句子 + 话题标签 / 表情 / 编号，再经过 clean_filename；返回 (文件名列表, 真实语言列表)
+def generate_filenames(count, seed=0):
+    rng = random.Random(seed)
+    names = []
+    languages = []
+    for _ in range(count):
+        language = rng.choice(list(SENTENCES))
+        words = rng.choice(SENTENCES[language]).split()
+        words = words[:rng.randint(2, len(words))]
+        words += rng.sample(NOISE, rng.randint(0, 3))
+        names.append(clean_filename(f"{rng.randint(1000, 999999)}_{' '.join(words)}"))
+        languages.append(language)
+    return names, languages
+
+
+# OCR 字幕：仓库中的识别结果（Results for ... 分段），再加上合成的多语言字幕
+def load_transcripts(paths):
+    transcripts = []
+    for path in paths:
+        if Path(path).exists():
+            text = Path(path).read_text(encoding="utf-8")
+            transcripts += [block.split("\n", 1)[1].strip() for block in re.split(r"\n?Results for ", text)
+                            if "\n" in block and block.split("\n", 1)[1].strip()]
+    return transcripts
+
+
+def generate_transcripts(count, seed=0):
+    rng = random.Random(seed)
+    transcripts = []
+    languages = []
+    for _ in range(count):
+        language = rng.choice(list(SENTENCES))
+        lines = [rng.choice(SENTENCES[language]) for _ in range(rng.randint(1, 6))]
+        transcripts.append("\n".join(lines))
+        languages.append(language)
+    return transcripts, languages
+
+
+def accuracy(results, truth):
+    return sum(result == language for result, language in zip(results, truth)) / len(truth)
+
+
+def measure(function, texts):
+    start = time.perf_counter()
+    results = [function(text) for text in texts]
+    return results, time.perf_counter() - start
+
+
+# truth 为真实语言时同时给出两种方法的准确率
+def run(name, texts, truth=None):
+    baseline, baseline_seconds = measure(detect_with_langdetect, texts)
+    fast, fast_seconds = measure(detect_language_from_text, texts)
+    decided = sum(classify_by_script(text) is not None for text in texts)
+    # 新旧结果不一致的样本（只可能来自快速判定）
+    differences = Counter((old, new) for text, old, new in zip(texts, baseline, fast) if old != new)
+    agreement = sum(old == new for old, new in zip(baseline, fast)) / len(texts)
+    print(f"{name}: {len(texts)} 条 | langdetect: {baseline_seconds:.3f}s | 快速判定 + langdetect: "
+          f"{fast_seconds:.3f}s | 加速 {baseline_seconds / fast_seconds:.1f}x | "
+          f"快速判定覆盖 {decided / len(texts):.0%} | 结果一致 {agreement:.1%}")
+    if truth is not None:
+        print(f"  准确率: langdetect {accuracy(baseline, truth):.1%} | 快速判定 + langdetect {accuracy(fast, truth):.1%}")
+    if differences:
+        print("  不一致 (langdetect -> 新结果): " + ", ".join(
+            f"{old}->{new} x{count}" for (old, new), count in differences.most_common(8)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比 langdetect 与文字系统快速判定的语言检测耗时和一致性")
+    parser.add_argument("--filenames", type=int, default=5000, help="合成文件名的数量")
+    parser.add_argument("--transcripts", type=int, default=2000, help="合成 OCR 字幕的数量")
+    parser.add_argument("--ocr-files", nargs="*", default=["英语语测试.txt", "赡养上帝.txt"],
+                        help="包含 Results for ... 分段的 OCR 结果文件")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run("文件名", *generate_filenames(args.filenames, args.seed))
+    real = load_transcripts(args.ocr_files)
+    if real:
+        run("OCR 结果文件", real * max(1, 1000 // len(real)))
+    run("合成 OCR 字幕", *generate_transcripts(args.transcripts, args.seed))
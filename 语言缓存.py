@@ -0,0 +1,50 @@
+from 数据库 import SQLiteStore
+
+
+class LanguageCache(SQLiteStore):
+    """
+    逐个文本文档的语言检测结果，按 (路径, 大小, 修改时间, 检测规则版本) 判断是否仍然有效。
+    按文件夹整批读取和写入，重新扫描时只有新增、修改过或由旧版规则检测的文档需要重新检测。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS languages (
+        path TEXT PRIMARY KEY,
+        folder TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        language TEXT NOT NULL,
+        detector INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS languages_folder ON languages (folder);
+    """
+
+    def __init__(self, db_path, detector_version=0, timeout=30):
+        self.detector_version = detector_version
+        super().__init__(db_path, timeout)
+        with self.connection() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(languages)")}
+            # 旧库没有版本列，已有的记录按版本 0 处理，检测规则更新后自然失效
+            if "detector" not in columns:
+                conn.execute("ALTER TABLE languages ADD COLUMN detector INTEGER NOT NULL DEFAULT 0")
+
+    # 返回 {路径: (大小, 修改时间, 语言)}；其他版本规则的结果不返回，重新检测后覆盖
+    def folder_entries(self, folder):
+        rows = self.connection().execute(
+            "SELECT path, size, mtime_ns, language FROM languages WHERE folder = ? AND detector = ?",
+            (str(folder), self.detector_version),
+        ).fetchall()
+        return {path: (size, mtime_ns, language) for path, size, mtime_ns, language in rows}
+
+    # rows: [(路径, 文件夹, 大小, 修改时间, 语言)]；同时删除文件夹中已不存在的文档的记录
+    def update_folder(self, folder, rows, existing_paths):
+        folder = str(folder)
+        with self.connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO languages (path, folder, size, mtime_ns, language, detector) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(*row, self.detector_version) for row in rows],
+            )
+            stale = [(path,) for path, in conn.execute("SELECT path FROM languages WHERE folder = ?", (folder,))
+                     if path not in existing_paths]
+            conn.executemany("DELETE FROM languages WHERE path = ?", stale)
@@ -0,0 +1,328 @@
+import multiprocessing
+import os
+import queue
+import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from tqdm import tqdm
+from 帧指纹 import FrameDeduper
+from 视频采样 import SamplingReport
+from OCR客户端 import OCR_CACHE_PATH, OCRClient, ocr_in_order
+from OCR缓存 import OCRCache
+from 拼图批处理 import MosaicBatcher
+from 结果存储 import open_result_store
+from 处理清单 import VideoManifest
+from 帧检查点 import FrameCheckpoint
+from 视频指纹 import VideoFingerprintIndex
+from 文字索引 import TextSearchIndex
+from 运行统计 import metrics
+from 识别视频内关键帧上文字 import collect_texts, find_duplicate_texts, frames_to_ocr, save_video_result
+
+# 解码进程每次交给 OCR 阶段的帧数，以及每个视频的通道中最多缓存的批数
+FRAME_CHUNK_SIZE = 16
+CHANNEL_CHUNKS = 4
+
+# 解码进程各自打开的视频指纹索引，按库路径缓存
+_video_indexes = {}
+
+
+# 解码阶段（子进程中运行）：抽帧、指纹去重、编码，把待 OCR 的帧按 chunk_size 一批写入该视频的通道，
+# 通道满时解码暂停，每个视频占用的内存与视频长度无关。通道中依次是：
+# ("start", (视频指纹, 可复用的文字或 None))、若干 ("frames", [(时间戳, 图片, 帧指纹)])、("end", None)；
+# 出错时以 ("error", 异常) 结束。返回去重统计 (total, skipped, snapshot)。
+# encode=False 时发送未编码的图片，由 OCR 阶段拼图后再编码；
+# collect_metrics=True 时同时返回本视频的分阶段统计，由主进程合并；
+# 从检查点继续时由 start 指定解码起点，last_hash 恢复去重状态；
+# 指定 video_index_path 时先计算视频指纹，与已识别的视频近似重复时不再解码，只发送可复用的文字
+def prepare_video(video_path, channel, max_hash_distance=4, sampling="fixed", crop_text=True, encode=True,
+                  collect_metrics=False, start=0.0, last_hash=None, video_index_path=None,
+                  chunk_size=FRAME_CHUNK_SIZE):
+    if collect_metrics:
+        metrics.reset()
+        metrics.enable()
+    deduper = FrameDeduper(max_distance=max_hash_distance)
+    deduper.last_hash = last_hash
+    sampling_report = SamplingReport()
+    reused_texts = None
+    try:
+        with metrics.scope(folder=video_path.parent.name, video=video_path.name):
+            fingerprint = None
+            if video_index_path is not None:
+                if video_index_path not in _video_indexes:
+                    _video_indexes[video_index_path] = VideoFingerprintIndex(video_index_path)
+                fingerprint, reused_texts = find_duplicate_texts(video_path, _video_indexes[video_index_path])
+            channel.put(("start", (fingerprint, reused_texts)))
+            if reused_texts is None:
+                chunk = []
+                for item in frames_to_ocr(video_path, deduper, crop_text, encode, sampling=sampling,
+                                          report=sampling_report, start=start):
+                    chunk.append(item)
+                    if len(chunk) >= chunk_size:
+                        channel.put(("frames", chunk))  # 通道满时在这里阻塞，形成背压
+                        chunk = []
+                if chunk:
+                    channel.put(("frames", chunk))
+        channel.put(("end", None))
+    except Exception as e:
+        channel.put(("error", e))
+    if sampling == "adaptive" and reused_texts is None:
+        print(sampling_report.summary(video_path.name))
+    snapshot = metrics.snapshot() if collect_metrics else None
+    return deduper.total, deduper.skipped, snapshot
+
+
+class FrameChannel:
+    """OCR 阶段读取 prepare_video 发送的消息；解码出错时抛出解码进程中的异常。"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.closed = False
+
+    def get(self):
+        kind, payload = self.channel.get()
+        if kind in ("end", "error"):
+            self.closed = True
+        if kind == "error":
+            raise payload
+        return kind, payload
+
+    def frames(self):
+        while True:
+            kind, payload = self.get()
+            if kind == "end":
+                return
+            yield from payload
+
+    # 识别中途失败时读完剩余的消息，否则解码进程会一直阻塞在写满的通道上
+    def drain(self):
+        while not self.closed:
+            try:
+                self.get()
+            except Exception:
+                break
+
+
+class VideoScheduler:
+    """
+    全局视频调度：所有子文件夹的视频展开成一个队列。
+    解码/指纹去重在进程池中运行，OCR 在线程中通过共享的异步客户端发出；
+    每个视频的帧经由各自的有界通道按批交给 OCR 线程，边解码边识别，OCR 跟不上时解码会暂停。
+    视频按提交顺序进入就绪队列，解码进程池也按提交顺序执行，最早的视频总有 OCR 线程在读取，不会互相等待。
+    提供 checkpoint 时逐帧保存 OCR 结果，中断的视频下次从断点继续解码和识别。
+    batch_size 大于 1 时所有 OCR 线程共用一个 MosaicBatcher，不同视频的帧也可以拼进同一张图。
+    ocr_urls 指定多个 OCR 服务实例时请求在它们之间均衡分配，max_in_flight 是每个实例的并发上限。
+    提供 video_index 时，与已识别视频近似重复的视频（转码后的转发等）直接复用之前的文字，不再解码和 OCR。
+    提供 text_index 时，每个视频的文字和时间戳在保存结果时写入全文索引。
+    """
+
+    def __init__(self, manifest, decode_workers=None, ocr_workers=4, max_in_flight=8,
+                 ready_queue_size=None, similarity_threshold=0.8, max_hash_distance=4, ocr_cache=None,
+                 sampling="fixed", crop_text=True, batch_size=None, checkpoint=None, ocr_urls=None, video_index=None,
+                 text_index=None, chunk_size=FRAME_CHUNK_SIZE):
+        self.manifest = manifest
+        self.video_index = video_index
+        self.text_index = text_index
+        self.checkpoint = checkpoint
+        self.ocr_cache = ocr_cache
+        self.decode_workers = decode_workers or os.cpu_count()
+        self.ocr_workers = ocr_workers
+        self.max_in_flight = max_in_flight
+        self.ocr_urls = ocr_urls
+        self.ready_queue_size = ready_queue_size or self.decode_workers
+        self.similarity_threshold = similarity_threshold
+        self.max_hash_distance = max_hash_distance
+        self.sampling = sampling
+        self.crop_text = crop_text
+        self.batch_size = batch_size if batch_size and batch_size > 1 else None
+        self.chunk_size = chunk_size
+        self.result_stores = {}
+        self.frames_total = 0
+        self.frames_skipped = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    # 收集所有子文件夹中尚未处理的视频
+    def discover(self, base_folder):
+        jobs = []
+        skipped = 0
+        for subfolder in sorted(Path(base_folder).iterdir()):
+            if not subfolder.is_dir():
+                continue
+            output_file = subfolder / f"{subfolder.name}_识别结果.xlsx"
+            self.result_stores[subfolder] = (open_result_store(output_file), output_file)
+            for video_file in sorted(subfolder.glob("*.mp4")):
+                with metrics.scope(folder=subfolder.name), metrics.timer("manifest"):
+                    processed = self.manifest.is_processed(video_file)
+                if processed:
+                    skipped += 1
+                else:
+                    jobs.append((subfolder, video_file))
+        print(f"Found {len(jobs)} videos to process, {skipped} already processed")
+        return jobs
+
+    # OCR 阶段：从就绪队列取出视频，边从通道读取解码出的帧边识别，按帧顺序去重并保存
+    def _ocr_worker(self, client, ready, progress):
+        while True:
+            job = ready.get()
+            if job is None:
+                break
+            subfolder, video_file, channel, video_progress = job
+            channel = FrameChannel(channel)
+            timestamps = []
+            try:
+                with metrics.scope(folder=subfolder.name, video=video_file.name):
+                    _, (fingerprint, extracted_texts) = channel.get()
+                    frames = channel.frames()
+                    if extracted_texts is None:
+                        with metrics.timer("ocr"):
+                            if video_progress is None:
+                                ocr_results = ocr_in_order(client, frames)
+                            else:
+                                ocr_results = video_progress.results(
+                                    ocr_in_order(client, video_progress.watch(frames)))
+                            extracted_texts = collect_texts(ocr_results, self.similarity_threshold, timestamps)
+                        if self.video_index is not None:
+                            self.video_index.add(video_file, fingerprint, extracted_texts)
+                    save_video_result(video_file.name, extracted_texts, self.result_stores[subfolder][0],
+                                      self.text_index, subfolder.name, timestamps)
+                    with metrics.timer("manifest"):
+                        self.manifest.mark_processed(video_file)
+                        if video_progress is not None:
+                            self.checkpoint.clear(video_file)
+                    metrics.count("videos_processed")
+            except subprocess.CalledProcessError as e:
+                metrics.count("videos_failed")
+                with self.lock:
+                    self.failed += 1
+                print(f"FFmpeg failed for {video_file.name}: {e}")
+            except Exception as e:
+                metrics.count("videos_failed")
+                with self.lock:
+                    self.failed += 1
+                print(f"Error processing {video_file.name}: {e}")
+            finally:
+                channel.drain()
+            progress.update(1)
+
+    # 解码结束后合并去重统计；视频的成功或失败由 OCR 线程记录
+    def _finish_decode(self, future, video_file, channel, progress):
+        try:
+            total, skipped, snapshot = future.result()
+        except Exception as e:
+            # 解码进程异常退出，或者错误无法通过通道发送
+            channel.put(("error", RuntimeError(f"decode failed for {video_file.name}: {e}")))
+            return
+        with self.lock:
+            self.frames_total += total
+            self.frames_skipped += skipped
+        if snapshot is not None:
+            metrics.merge(snapshot)
+        progress.set_postfix(frames=self.frames_total, ocr_saved=self.frames_skipped, failed=self.failed)
+
+    # 本次运行共用的 OCR 客户端；基准测试覆盖它以记录请求耗时
+    def make_client(self):
+        return OCRClient(urls=self.ocr_urls, max_in_flight=self.max_in_flight, cache=self.ocr_cache)
+
+    # 提交或解码进程池出错时，让所有还在等待的通道以错误结束
+    def _fail_pending(self, pending, error):
+        for video_file, channel in pending.values():
+            try:
+                channel.put(("error", RuntimeError(f"decode failed for {video_file.name}: {error}")))
+            except Exception:
+                pass  # manager 已退出时 OCR 线程读取通道同样会出错
+        pending.clear()
+
+    def run(self, base_folder):
+        jobs = self.discover(base_folder)
+        ready = queue.Queue(maxsize=self.ready_queue_size)
+        client = self.make_client()
+        batcher = MosaicBatcher(client, self.batch_size) if self.batch_size else None
+        progress = tqdm(total=len(jobs), desc="Processing videos", unit="video")
+
+        ocr_threads = [
+            threading.Thread(target=self._ocr_worker, args=(batcher or client, ready, progress), daemon=True)
+            for _ in range(self.ocr_workers)
+        ]
+        for thread in ocr_threads:
+            thread.start()
+
+        # manager 和解码进程用 spawn 启动：此时 OCR 线程和客户端的事件循环线程已经在运行，
+        # fork 出的子进程可能继承被这些线程持有的锁
+        context = multiprocessing.get_context("spawn")
+        try:
+            with context.Manager() as manager, \
+                    ProcessPoolExecutor(max_workers=self.decode_workers, mp_context=context) as pool:
+                pending = {}
+                submitted = 0
+                try:
+                    for job in jobs:
+                        # 最多提交 2 倍进程数的解码任务
+                        while len(pending) >= self.decode_workers * 2:
+                            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                self._finish_decode(future, *pending.pop(future), progress)
+                        subfolder, video_file = job
+                        video_progress = self.checkpoint.open(video_file) if self.checkpoint is not None else None
+                        start, last_hash = 0.0, None
+                        if video_progress is not None and video_progress.done:
+                            start, last_hash = video_progress.start_time(), video_progress.last_hash
+                        channel = manager.Queue(maxsize=CHANNEL_CHUNKS)
+                        future = pool.submit(prepare_video, video_file, channel, self.max_hash_distance,
+                                             self.sampling, self.crop_text, batcher is None, metrics.enabled,
+                                             start, last_hash,
+                                             self.video_index.db_path if self.video_index is not None else None,
+                                             self.chunk_size)
+                        pending[future] = (video_file, channel)
+                        ready.put((subfolder, video_file, channel, video_progress))  # 队列满时在这里阻塞，暂停提交新视频
+                        submitted += 1
+                    for future in list(pending):
+                        self._finish_decode(future, *pending.pop(future), progress)
+                except BaseException as e:
+                    # 已交给 OCR 线程的视频都要收到结束消息，否则线程一直等待通道，下面的结束标记也放不进就绪队列
+                    self._fail_pending(pending, e)
+                    if not isinstance(e, BrokenProcessPool):
+                        raise
+                    print(f"Decode pool broken, {len(jobs) - submitted} videos left for the next run: {e}")
+                # OCR 线程读完所有通道后才能关闭 manager
+                for _ in ocr_threads:
+                    ready.put(None)
+                for thread in ocr_threads:
+                    thread.join()
+        finally:
+            if any(thread.is_alive() for thread in ocr_threads):
+                for _ in ocr_threads:
+                    ready.put(None)
+                for thread in ocr_threads:
+                    thread.join()
+            progress.close()
+            if batcher is not None:
+                batcher.close()
+            client.close()
+
+        # 每个文件夹一次性导出 Excel
+        for subfolder, (result_store, output_file) in self.result_stores.items():
+            if result_store.count():
+                with metrics.scope(folder=subfolder.name), metrics.timer("export"):
+                    result_store.export(output_file)
+
+        print(f"Done: {submitted - self.failed} videos processed, {self.failed} failed, "
+              f"{self.frames_skipped}/{self.frames_total} OCR calls saved by frame dedup")
+        if batcher is not None:
+            print(batcher.report())
+        print(client.endpoint_report())
+        if self.ocr_cache is not None:
+            print(self.ocr_cache.report())
+
+
+def run_all(base_folder, manifest_path="processed_videos.db", legacy_record_file="processed_videos.txt",
+            ocr_cache_path=OCR_CACHE_PATH, checkpoint_path="frame_checkpoints.db",
+            video_index_path="video_fingerprints.db", text_index_path="video_texts.db", **kwargs):
+    manifest = VideoManifest(manifest_path, legacy_record_file=legacy_record_file)
+    ocr_cache = OCRCache(ocr_cache_path) if ocr_cache_path else None
+    checkpoint = FrameCheckpoint(checkpoint_path) if checkpoint_path else None
+    video_index = VideoFingerprintIndex(video_index_path) if video_index_path else None
+    text_index = TextSearchIndex(text_index_path) if text_index_path else None
+    VideoScheduler(manifest, ocr_cache=ocr_cache, checkpoint=checkpoint, video_index=video_index,
+                   text_index=text_index, **kwargs).run(base_folder)
@@ -0,0 +1,268 @@
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_NULL_CONTEXT = contextlib.nullcontext()
+# 当前的 (文件夹, 视频)；每个线程 / asyncio 任务各有一份
+_scope = contextvars.ContextVar("metrics_scope", default=("", ""))
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "scope", "start")
+
+    def __init__(self, metrics, stage, scope):
+        self.metrics = metrics
+        self.stage = stage
+        self.scope = scope
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.stage, time.perf_counter() - self.start, scope=self.scope)
+        return False
+
+
+class Metrics:
+    """
+    轻量的分阶段统计：按 (文件夹, 视频, 阶段) 记录调用次数、耗时和字节数，另有按名称累加的计数器。
+    默认关闭，关闭时 timer()/scope() 返回共享的空上下文，timed_iter()/bind() 原样返回参数，几乎没有开销。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.server = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # (folder, video, stage) -> [calls, seconds, bytes]
+            self.stages = defaultdict(lambda: [0, 0.0, 0])
+            # (folder, video, name) -> value
+            self.counters = defaultdict(int)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    # 在 with 块内记录的数据都归到这个文件夹 / 视频下；参数为 None 时沿用外层的值
+    def scope(self, folder=None, video=None):
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._scope(folder, video)
+
+    @contextlib.contextmanager
+    def _scope(self, folder, video):
+        outer_folder, outer_video = _scope.get()
+        token = _scope.set((outer_folder if folder is None else str(folder),
+                            outer_video if video is None else str(video)))
+        try:
+            yield
+        finally:
+            _scope.reset(token)
+
+    def timer(self, stage):
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _Timer(self, stage, _scope.get())
+
+    def record(self, stage, seconds, nbytes=0, calls=1, scope=None):
+        folder, video = scope or _scope.get()
+        with self.lock:
+            entry = self.stages[folder, video, stage]
+            entry[0] += calls
+            entry[1] += seconds
+            entry[2] += nbytes
+
+    def add_bytes(self, stage, nbytes):
+        if self.enabled:
+            self.record(stage, 0.0, nbytes, calls=0)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            folder, video = _scope.get()
+            with self.lock:
+                self.counters[folder, video, name] += value
+
+    # 把每次从 iterable 取下一个元素的耗时记为一次 stage 调用
+    def timed_iter(self, stage, iterable):
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(stage, iterable)
+
+    def _timed_iter(self, stage, iterable):
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                self.record(stage, time.perf_counter() - start)
+                yield item
+        finally:
+            # 提前结束时关闭内层生成器，让它清理子进程等资源
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    # 让在事件循环线程中运行的协程沿用提交方的文件夹 / 视频
+    def bind(self, coroutine):
+        if not self.enabled:
+            return coroutine
+        return self._in_scope(_scope.get(), coroutine)
+
+    @staticmethod
+    async def _in_scope(scope, coroutine):
+        _scope.set(scope)  # 任务有自己的上下文副本，不影响事件循环线程
+        return await coroutine
+
+    # 可以 pickle 的原始数据，用于从子进程带回主进程
+    def snapshot(self):
+        with self.lock:
+            return {
+                "stages": [[*key, *value] for key, value in self.stages.items()],
+                "counters": [[*key, value] for key, value in self.counters.items()],
+            }
+
+    def merge(self, snapshot):
+        with self.lock:
+            for folder, video, stage, calls, seconds, nbytes in snapshot["stages"]:
+                entry = self.stages[folder, video, stage]
+                entry[0] += calls
+                entry[1] += seconds
+                entry[2] += nbytes
+            for folder, video, name, value in snapshot["counters"]:
+                self.counters[folder, video, name] += value
+
+    # 按 key_func(folder, video) 分组汇总
+    def _grouped(self, key_func):
+        stages = defaultdict(lambda: defaultdict(lambda: [0, 0.0, 0]))
+        counters = defaultdict(lambda: defaultdict(int))
+        with self.lock:
+            for (folder, video, stage), (calls, seconds, nbytes) in self.stages.items():
+                entry = stages[key_func(folder, video)][stage]
+                entry[0] += calls
+                entry[1] += seconds
+                entry[2] += nbytes
+            for (folder, video, name), value in self.counters.items():
+                counters[key_func(folder, video)][name] += value
+        return stages, counters
+
+    def summary(self):
+        stages, counters = self._grouped(lambda folder, video: "")
+        lines = [f"{'Stage':<14}{'Calls':>10}{'Total s':>12}{'Mean ms':>12}{'MB':>12}"]
+        for stage, (calls, seconds, nbytes) in sorted(stages[""].items(), key=lambda item: -item[1][1]):
+            mean = seconds / calls * 1000 if calls else 0.0
+            lines.append(f"{stage:<14}{calls:>10}{seconds:>12.3f}{mean:>12.2f}{nbytes / 1024 ** 2:>12.2f}")
+        if counters[""]:
+            lines.append("Counters: " + ", ".join(f"{name}={value}" for name, value in sorted(counters[""].items())))
+
+        folder_stages, _ = self._grouped(lambda folder, video: folder)
+        if len(folder_stages) > 1 or "" not in folder_stages:
+            names = sorted({stage for entries in folder_stages.values() for stage in entries})
+            lines.append("")
+            lines.append(f"{'Folder (s)':<24}" + "".join(f"{name:>12}" for name in names))
+            for folder, entries in sorted(folder_stages.items()):
+                lines.append(f"{folder or '-':<24}" + "".join(
+                    f"{entries[name][1]:>12.3f}" if name in entries else f"{'':>12}" for name in names))
+        return "\n".join(lines)
+
+    def to_dict(self):
+        def as_dict(stages, counters):
+            return {
+                "stages": {stage: {"calls": calls, "seconds": seconds, "bytes": nbytes}
+                           for stage, (calls, seconds, nbytes) in stages.items()},
+                "counters": dict(counters),
+            }
+
+        total_stages, total_counters = self._grouped(lambda folder, video: "")
+        folder_stages, folder_counters = self._grouped(lambda folder, video: folder)
+        video_stages, video_counters = self._grouped(lambda folder, video: (folder, video))
+        videos = defaultdict(dict)
+        for folder, video in set(video_stages) | set(video_counters):
+            if video:
+                videos[folder][video] = as_dict(video_stages[folder, video], video_counters[folder, video])
+        return {
+            "total": as_dict(total_stages[""], total_counters[""]),
+            "folders": {folder: as_dict(folder_stages[folder], folder_counters[folder])
+                        for folder in set(folder_stages) | set(folder_counters)},
+            "videos": videos,
+        }
+
+    def write(self, metrics_file):
+        with open(metrics_file, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    # Prometheus 文本格式，按文件夹汇总（逐视频的数据见 write() 输出的文件）
+    def exposition(self):
+        def label(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        stages, counters = self._grouped(lambda folder, video: folder)
+        lines = []
+        for metric, index in (("calls", 0), ("seconds", 1), ("bytes", 2)):
+            lines.append(f"# TYPE pipeline_stage_{metric}_total counter")
+            for folder, entries in sorted(stages.items()):
+                for stage, values in sorted(entries.items()):
+                    lines.append(f'pipeline_stage_{metric}_total{{folder="{label(folder)}",stage="{label(stage)}"}} '
+                                 f"{values[index]}")
+        lines.append("# TYPE pipeline_events_total counter")
+        for folder, entries in sorted(counters.items()):
+            for name, value in sorted(entries.items()):
+                lines.append(f'pipeline_events_total{{folder="{label(folder)}",name="{label(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    # 在后台线程提供 GET /metrics，运行中途也可以抓取
+    def serve(self, port, host="127.0.0.1"):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Metrics available at http://{host}:{port}/metrics")
+        return self.server
+
+    # 开始统计；指定 port 时同时启动文本端点
+    def start(self, port=None):
+        self.enable()
+        if port:
+            self.serve(port)
+
+    # 运行结束：打印汇总表，指定 metrics_file 时写出 JSON
+    def finish(self, metrics_file=None):
+        if not self.enabled:
+            return
+        print(self.summary())
+        if metrics_file:
+            self.write(metrics_file)
+            print(f"Metrics written to {metrics_file}")
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+
+
+metrics = Metrics()